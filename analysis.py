@@ -0,0 +1,159 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from draw_result import read_results
+
+# A results set is read once into arrays sorted by burstiness; slopes,
+# proportions and confidence bands of every source come out of one pass over
+# them. Figures are rendered headless in worker processes, and a figure whose
+# inputs hash to the value recorded beside it is not rendered again.
+
+sources = ["data", "voice", "video", "total"]
+
+# Bumped when the drawing changes, so cached figures are redrawn.
+style_version = 1
+
+# (kind, min burstiness, max burstiness, file name)
+figures = [
+    ("response_times", 1, 10, "response_time_1_10.png"),
+    ("response_times", 10, 100, "response_time_10_100.png"),
+    ("sent_packets", 1, 10, "packet_proportion_1_10.png"),
+    ("sent_packets", 10, 100, "packet_proportion_10_100.png"),
+]
+
+# Columns each kind of figure draws, and so the ones its hash covers.
+figure_columns = {
+    "response_times": ["burstiness"] + [f"{source}_response_time" for source in sources],
+    "sent_packets": ["burstiness"] + [f"{source}_sent_packet" for source in sources],
+}
+
+def load(path):
+    # Replications of a burstiness are averaged; the half-width of their mean
+    # is the root of the summed squared half-widths over their count.
+    data = read_results(path)
+    columns = {name: data[name].to_numpy(dtype=float) for name in data.columns if name != "key"}
+    burstiness, group, counts = np.unique(columns.pop("burstiness"), return_inverse=True, return_counts=True)
+    half_widths = {source: columns[f"{source}_confidence_interval"] * columns[f"{source}_response_time"] for source in sources}
+    loaded = {"burstiness": burstiness, "replications": counts}
+    for name, values in columns.items():
+        loaded[name] = np.bincount(group, weights=values, minlength=len(burstiness)) / counts
+    for source in sources:
+        half_width = np.sqrt(np.bincount(group, weights=half_widths[source] ** 2, minlength=len(burstiness))) / counts
+        loaded[f"{source}_confidence_interval"] = half_width / loaded[f"{source}_response_time"]
+    return loaded
+
+def summarize(columns):
+    # Rows are the sources, in the order of the sources list.
+    response = np.vstack([columns[f"{source}_response_time"] for source in sources])
+    sent = np.vstack([columns[f"{source}_sent_packet"] for source in sources])
+    ratio = np.vstack([columns[f"{source}_confidence_interval"] for source in sources])
+    slope = (np.diff(response, axis=1) / np.diff(columns["burstiness"])).mean(axis=1) * 1000
+    proportion = sent[:3] / sent[3] * 100
+    lower, upper = response * (1 - ratio), response * (1 + ratio)
+    return {
+        "slopes": dict(zip(sources, slope)),
+        "proportions": dict(zip(sources[:3], proportion)),
+        "bands": {f"{source}_response_time": (lower[i], upper[i]) for i, source in enumerate(sources)},
+    }
+
+def slopes(path):
+    return summarize(load(path))["slopes"]
+
+def select(kind, columns, summary, min_burstiness, max_burstiness):
+    inside = (columns["burstiness"] >= min_burstiness) & (columns["burstiness"] <= max_burstiness)
+    data = {name: columns[name][inside] for name in figure_columns[kind]}
+    bands = {}
+    if kind == "response_times":
+        bands = {name: (lower[inside], upper[inside]) for name, (lower, upper) in summary["bands"].items()}
+    return data, bands
+
+def figure_hash(kind, min_burstiness, max_burstiness, data, bands):
+    digest = hashlib.sha256(json.dumps([kind, min_burstiness, max_burstiness, style_version]).encode())
+    for name in sorted(data):
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(data[name], dtype=float).tobytes())
+    for name in sorted(bands):
+        digest.update(np.ascontiguousarray(bands[name], dtype=float).tobytes())
+    return digest.hexdigest()
+
+def render_figure(kind, min_burstiness, max_burstiness, data, bands, path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    from draw_result import draw_response_times, draw_sent_packet_proportion
+
+    if kind == "response_times":
+        draw_response_times(plt, data, bands)
+    else:
+        draw_sent_packet_proportion(plt, data, min_burstiness, max_burstiness)
+    plt.savefig(path)
+    plt.close()
+    return path
+
+def render_all(columns, summary, output_dir="Results", workers=None, force=False):
+    # Returns the file names rendered and those left as they were.
+    os.makedirs(output_dir, exist_ok=True)
+    cache_path = os.path.join(output_dir, ".figures.json")
+    cache = {}
+    if os.path.exists(cache_path) and not force:
+        with open(cache_path) as file:
+            cache = json.load(file)
+
+    pending = []
+    skipped = []
+    for kind, min_burstiness, max_burstiness, name in figures:
+        data, bands = select(kind, columns, summary, min_burstiness, max_burstiness)
+        key = figure_hash(kind, min_burstiness, max_burstiness, data, bands)
+        path = os.path.join(output_dir, name)
+        if cache.get(name) == key and os.path.exists(path):
+            skipped.append(name)
+            continue
+        pending.append((name, key, (kind, min_burstiness, max_burstiness, data, bands, path)))
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(name, key, executor.submit(render_figure, *arguments)) for name, key, arguments in pending]
+            for name, key, future in futures:
+                future.result()
+                cache[name] = key
+        temporary = cache_path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump(cache, file, indent=2, sort_keys=True)
+        os.replace(temporary, cache_path)
+    return [name for name, _, _ in pending], skipped
+
+def print_summary(columns, summary):
+    for source in sources:
+        print(f"{source.capitalize()} Slope: {summary['slopes'][source]}")
+    print(f"{'burstiness':>10}{'data %':>9}{'voice %':>9}{'video %':>9}{'total CI':>10}")
+    for i, burstiness in enumerate(columns["burstiness"]):
+        proportions = summary["proportions"]
+        print(f"{burstiness:>10g}{proportions['data'][i]:>9.2f}{proportions['voice'][i]:>9.2f}{proportions['video'][i]:>9.2f}{columns['total_confidence_interval'][i]:>10.4f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a burstiness sweep and render the figures of Results/.")
+    parser.add_argument("csv_file", nargs="?", default="data_full.csv", help="sweep results, CSV or a result-store export (.npz)")
+    parser.add_argument("--output-dir", default="Results")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="render every figure even if its inputs are unchanged")
+    parser.add_argument("--no-figures", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+
+    columns = load(args.csv_file)
+    summary = summarize(columns)
+    print_summary(columns, summary)
+    if not args.no_figures:
+        rendered, skipped = render_all(columns, summary, args.output_dir, args.workers, args.force)
+        for name in rendered:
+            print(f"Rendered {os.path.join(args.output_dir, name)}")
+        if skipped:
+            print(f"{len(skipped)} figure(s) unchanged: {', '.join(skipped)}")
+
+if __name__ == "__main__":
+    main()
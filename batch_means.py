@@ -0,0 +1,148 @@
+import math
+
+import numpy as np
+
+class BatchMeans(object):
+    # Streaming batch-means estimator. Samples only accumulate into the open
+    # block; the block means and their Welford mean/variance are updated when
+    # a block boundary is crossed. Blocks span block_length time units, or
+    # block_length samples with by_count=True. Empty blocks are skipped.
+    __slots__ = ("block_length", "by_count", "multiplier", "next_boundary", "block_sum", "block_count",
+                 "count", "mean", "m2", "closed_sum", "closed_samples", "history")
+
+    def __init__(self, block_length, by_count=False, multiplier=4.5, start=0.0, keep_history=False):
+        self.block_length = block_length
+        self.by_count = by_count
+        self.multiplier = multiplier
+        self.next_boundary = block_length if by_count else start + block_length
+        self.block_sum = 0.0
+        self.block_count = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.closed_sum = 0.0
+        self.closed_samples = 0
+        self.history = [] if keep_history else None
+
+    def add(self, now, value):
+        if self.by_count:
+            self.block_sum += value
+            self.block_count += 1
+            if self.block_count >= self.block_length:
+                self.close_block()
+            return
+
+        if now >= self.next_boundary:
+            self.close_block()
+            self.next_boundary += (math.floor((now - self.next_boundary) / self.block_length) + 1) * self.block_length
+        self.block_sum += value
+        self.block_count += 1
+
+    def close_block(self):
+        if self.block_count > 0:
+            self.update(self.block_sum / self.block_count)
+            self.closed_sum += self.block_sum
+            self.closed_samples += self.block_count
+        self.block_sum = 0.0
+        self.block_count = 0
+
+    def update(self, block_mean):
+        self.count += 1
+        delta = block_mean - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (block_mean - self.mean)
+        if self.history is not None:
+            self.history.append(block_mean)
+
+    def add_many(self, times, values):
+        # Batched form of add for samples sorted by time.
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+
+        if self.by_count:
+            offsets = self.block_count + np.arange(len(values))
+            blocks = offsets // self.block_length
+        else:
+            block_start = self.next_boundary - self.block_length
+            blocks = np.floor((np.asarray(times, dtype=float) - block_start) / self.block_length).astype(np.int64)
+            blocks = np.maximum(blocks, 0)
+
+        sums = np.bincount(blocks, weights=values)
+        counts = np.bincount(blocks)
+        last = len(sums) - 1
+        if last == 0 and not (self.by_count and self.block_count + counts[0] >= self.block_length):
+            self.block_sum += float(sums[0])
+            self.block_count += int(counts[0])
+            return
+
+        sums[0] += self.block_sum
+        counts[0] += self.block_count
+        if self.by_count and counts[last] >= self.block_length:
+            last += 1
+        closed = counts[:last] > 0
+        self.merge(sums[:last][closed] / counts[:last][closed])
+        self.closed_sum += float(sums[:last].sum())
+        self.closed_samples += int(counts[:last].sum())
+        if last < len(sums):
+            self.block_sum = float(sums[last])
+            self.block_count = int(counts[last])
+        else:
+            self.block_sum = 0.0
+            self.block_count = 0
+        if not self.by_count:
+            self.next_boundary += last * self.block_length
+
+    def merge(self, block_means):
+        # Chan et al. parallel update of the running mean and M2 with a batch of block means.
+        count = len(block_means)
+        if count == 0:
+            return
+        batch_mean = float(block_means.mean())
+        batch_m2 = float(np.sum((block_means - batch_mean) ** 2))
+        total = self.count + count
+        delta = batch_mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += batch_m2 + delta * delta * self.count * count / total
+        self.count = total
+        if self.history is not None:
+            self.history.extend(block_means.tolist())
+
+    def get_state(self):
+        state = {name: getattr(self, name) for name in ("next_boundary", "block_sum", "block_count", "count", "mean", "m2", "closed_sum", "closed_samples")}
+        if self.history is not None:
+            state["history"] = np.asarray(self.history, dtype=float)
+        return state
+
+    def set_state(self, state):
+        for name in ("next_boundary", "block_sum", "mean", "m2", "closed_sum"):
+            setattr(self, name, float(state[name]))
+        for name in ("block_count", "count", "closed_samples"):
+            setattr(self, name, int(state[name]))
+        if self.history is not None:
+            self.history = state["history"].tolist()
+
+    def total_count(self):
+        return self.closed_samples + self.block_count
+
+    def total_sum(self):
+        return self.closed_sum + self.block_sum
+
+    def average(self):
+        samples = self.total_count()
+        if samples == 0:
+            return None
+        return self.total_sum() / samples
+
+    def standard_deviation(self):
+        if self.count <= 1:
+            return None
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def half_width(self, now=None):
+        standard_deviation = self.standard_deviation()
+        if standard_deviation is None:
+            return math.inf
+        if self.by_count or now is None:
+            return self.multiplier * standard_deviation / math.sqrt(self.count)
+        return self.multiplier * standard_deviation * math.sqrt(self.block_length / now)
@@ -0,0 +1,41 @@
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.server_modes import cases
+from benchmarks.source_events import CountingEnvironment
+from event_kernel import Environment
+
+def create_backend(backend):
+    # CountingEnvironment adds one call per event to simpy; the kernel counts
+    # its events natively in scheduled_events.
+    return CountingEnvironment() if backend == "simpy" else Environment()
+
+def measure(name, backend, horizon, persistent_server=True):
+    build, _ = cases[name]
+    np.random.seed(10)
+    env = create_backend(backend)
+    served_packets = build(env, persistent_server)
+    start_time = time.perf_counter()
+    env.run(until=horizon)
+    wall_time = time.perf_counter() - start_time
+    return env.scheduled_events, served_packets(), wall_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare events/sec of simpy and the lean event kernel on the same models.")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier applied to every simulated horizon")
+    parser.add_argument("--models", nargs="+", choices=list(cases), default=["exerciseMM1NForComparison"])
+    args = parser.parse_args()
+
+    print(f"{'script':<28}{'backend':<9}{'events':>12}{'served':>12}{'events/s':>12}{'wall s':>9}{'speedup':>9}")
+    for name in args.models:
+        horizon = cases[name][1] * args.scale
+        simpy_wall_time = None
+        for backend in ["simpy", "kernel"]:
+            events, served, wall_time = measure(name, backend, horizon)
+            simpy_wall_time = simpy_wall_time or wall_time
+            print(f"{name:<28}{backend:<9}{events:>12}{served:>12}{events / wall_time:>12.0f}{wall_time:>9.2f}{simpy_wall_time / wall_time:>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import collections
+import concurrent.futures
+import multiprocessing
+import queue
+import tracemalloc
+
+import numpy as np
+
+import simulation_project as sp
+from benchmarks.suite import peak_rss_mb
+from event_kernel import create_environment
+from packet_ring import PacketRing
+
+class Packet(object):   # packet object of the original simulation_project
+    def __init__(self, source, packet_size):
+        self.source = source
+        self.packet_size = packet_size
+        self.enter_time = 0
+
+class SlottedPacket(object):
+    __slots__ = ("source", "packet_size", "enter_time")
+
+    def __init__(self, source, packet_size):
+        self.source = source
+        self.packet_size = packet_size
+        self.enter_time = 0
+
+def fill_queue(count):
+    buffer = queue.Queue()
+    source = object()
+    for i in range(count):
+        packet = Packet(source, 8000)
+        packet.enter_time = i * 1e-6
+        buffer.put(packet)
+    return buffer
+
+def fill_slotted(count):
+    buffer = collections.deque()
+    source = object()
+    for i in range(count):
+        packet = SlottedPacket(source, 8000)
+        packet.enter_time = i * 1e-6
+        buffer.append(packet)
+    return buffer
+
+def fill_ring(count):
+    buffer = PacketRing()
+    for i in range(count):
+        buffer.put(i * 1e-6, 8000, 2)
+    return buffer
+
+layouts = {
+    "Packet in queue.Queue": fill_queue,
+    "slotted Packet in deque": fill_slotted,
+    "PacketRing": fill_ring,
+}
+
+def bytes_per_packet(fill, count):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    buffer = fill(count)
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del buffer
+    return size / count
+
+def long_run(burstiness, horizon, backend, seed):
+    # Peak RSS of one model in its own process, with the deepest backlog seen
+    # by the queue.
+    env = create_environment(backend)
+    sources, result = sp.create_model(env, burstiness, np.random.SeedSequence(seed))
+    q = sources["Data Source"].queue
+    start_rss = peak_rss_mb()
+    depth = [0]
+    reception = q.reception
+
+    def tracked(source_id, packet_size):
+        reception(source_id, packet_size)
+        depth[0] = max(depth[0], len(q.buffer))
+    q.reception = tracked
+    env.run(until=horizon)
+    return {"start_rss_mb": start_rss, "peak_rss_mb": peak_rss_mb(), "peak_depth": depth[0],
+            "ring_capacity": q.buffer.capacity, "packets": result.get_total_sent_packet()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per queued packet of the packet layouts, and peak RSS of a long run at high burstiness.")
+    parser.add_argument("--count", type=int, default=200000, help="packets queued per layout")
+    parser.add_argument("--burstiness", type=float, default=100.0)
+    parser.add_argument("--horizon", type=float, default=20.0, help="simulated seconds of the long run")
+    parser.add_argument("--backend", choices=["simpy", "kernel"], default="kernel")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    costs = {name: bytes_per_packet(fill, args.count) for name, fill in layouts.items()}
+    print(f"{'layout':<26}{'bytes/packet':>14}")
+    for name, cost in costs.items():
+        print(f"{name:<26}{cost:>14.1f}")
+
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        run = executor.submit(long_run, args.burstiness, args.horizon, args.backend, args.seed).result()
+    print(f"Burstiness {args.burstiness:g} over {args.horizon:g} s: {run['packets']} packets, peak backlog {run['peak_depth']} packets "
+          f"(ring of {run['ring_capacity']} entries, {run['ring_capacity'] * 16 / 1024:.0f} kB)")
+    print(f"RSS after building the model {run['start_rss_mb']:.1f} MB, peak {run['peak_rss_mb']:.1f} MB")
+    print(f"The peak backlog would hold {run['peak_depth'] * costs['Packet in queue.Queue'] / 1024:.0f} kB as Packet objects in queue.Queue")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import argparse
+import tempfile
+import time
+
+import pandas as pd
+
+from metrics_recorder import ColumnRecorder
+
+def time_windows(append, samples, window):
+    costs = []
+    for start in range(0, samples, window):
+        start_time = time.perf_counter()
+        for i in range(start, start + window):
+            append(i % 3, float(i), 0.5)
+        costs.append((time.perf_counter() - start_time) / window)
+    return costs
+
+def dataframe_append(df):
+    def append(source_id, t, loss_rate):
+        df.loc[len(df)] = {'sourceId': source_id, 'time': t, 'lossRate': loss_rate}
+    return append
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-sample cost of DataFrame.loc appends versus the column recorder as the run grows.")
+    parser.add_argument("--dataframe-samples", type=int, default=20000)
+    parser.add_argument("--recorder-samples", type=int, default=2000000)
+    parser.add_argument("--windows", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=65536)
+    args = parser.parse_args()
+
+    df = pd.DataFrame(columns=['sourceId', 'time', 'lossRate'])
+    costs = time_windows(dataframe_append(df), args.dataframe_samples, args.dataframe_samples // args.windows)
+    print("DataFrame.loc append (us/sample per window):", " ".join(f"{c * 1e6:.1f}" for c in costs))
+
+    recorder = ColumnRecorder({'sourceId': 'category', 'time': 'f8', 'lossRate': 'f8'}, chunk_size=args.chunk_size)
+    costs = time_windows(recorder.append, args.recorder_samples, args.recorder_samples // args.windows)
+    print("Recorder in memory (us/sample per window):  ", " ".join(f"{c * 1e6:.2f}" for c in costs))
+
+    with tempfile.TemporaryDirectory() as spill_dir:
+        recorder = ColumnRecorder({'sourceId': 'category', 'time': 'f8', 'lossRate': 'f8'}, chunk_size=args.chunk_size, spill_dir=spill_dir)
+        costs = time_windows(recorder.append, args.recorder_samples, args.recorder_samples // args.windows)
+        print("Recorder spilling .npy (us/sample per window):", " ".join(f"{c * 1e6:.2f}" for c in costs))
+        start_time = time.perf_counter()
+        frame = recorder.to_frame()
+        print(f"Frame of {len(frame)} rows built in {time.perf_counter() - start_time:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import time
+
+import numpy as np
+
+import exerciseMM1NForComparison as mm1n
+import loss_rate_estimation as lre
+import simulation_project as sp
+from benchmarks.source_events import CountingEnvironment
+
+def build_mm1n(env, persistent_server):
+    q = mm1n.queueClass(env, 10, 1.0, persistentServer=persistent_server)
+    ps1 = mm1n.poissonSource(env, 0.9, q)
+    return lambda: ps1.nbEmissions - ps1.queueLosses
+
+def build_loss_rate(env, persistent_server):
+    q = lre.queueClass(env, 10, 1.0, persistentServer=persistent_server)
+    lre.poissonSource(env, 0.1, q, 1, 1)
+    lre.poissonSource(env, 0.7, q, 2, 1)
+    return lambda: q.packetReceivedTotal - q.packetLossTotal
+
+def build_simulation_project(env, persistent_server, burstiness=20.0):
+    seeds = np.random.SeedSequence(1).spawn(3)
+    result = sp.Result(env)
+    q = sp.QueueClass(env, sp.service_rate, persistent_server=persistent_server)
+    sp.DataSource(env, q, sp.data_rate, result, rng=np.random.default_rng(seeds[0]))
+    sp.VoiceSource(env, q, sp.voice_packet_size, sp.voice_rate, result, rng=np.random.default_rng(seeds[1]))
+    sp.VideoSource(env, q, sp.video_packet_size, burstiness, sp.video_rate, sp.video_on_time_average, result, rng=np.random.default_rng(seeds[2]))
+    return lambda: result.get_total_processed_packet()
+
+cases = {
+    "exerciseMM1NForComparison": (build_mm1n, 200000.0),
+    "loss_rate_estimation": (build_loss_rate, 200000.0),
+    "simulation_project": (build_simulation_project, 5.0),
+}
+
+def measure(name, persistent_server, horizon):
+    build, _ = cases[name]
+    np.random.seed(10)
+    env = CountingEnvironment()
+    served_packets = build(env, persistent_server)
+    start_time = time.perf_counter()
+    env.run(until=horizon)
+    wall_time = time.perf_counter() - start_time
+    return env.scheduled_events / wall_time, served_packets() / wall_time, wall_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-packet service processes with one persistent server process.")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier applied to every simulated horizon")
+    args = parser.parse_args()
+
+    print(f"{'script':<28}{'server':<14}{'events/s':>12}{'packets/s':>12}{'wall s':>9}")
+    for name, (_, horizon) in cases.items():
+        for persistent_server in [False, True]:
+            events_rate, packet_rate, wall_time = measure(name, persistent_server, horizon * args.scale)
+            mode = "persistent" if persistent_server else "per-packet"
+            print(f"{name:<28}{mode:<14}{events_rate:>12.0f}{packet_rate:>12.0f}{wall_time:>9.2f}")
+
+if __name__ == "__main__":
+    main()
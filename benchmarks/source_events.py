@@ -0,0 +1,66 @@
+import argparse
+import math
+import time
+
+import simpy
+
+from simulation_project import DataSource, VoiceSource, VideoSource, Result
+
+class CountingEnvironment(simpy.Environment):
+    def __init__(self, initial_time=0):
+        super().__init__(initial_time)
+        self.scheduled_events = 0
+
+    def schedule(self, event, priority=simpy.core.NORMAL, delay=0):
+        self.scheduled_events += 1
+        super().schedule(event, priority, delay)
+
+class NullQueue(object):
+    def register(self, source):
+        return 0
+
+    def reception(self, source_id, packet_size):
+        pass
+
+def build_source(env, source_type, burstiness):
+    result = Result(env)
+    q = NullQueue()
+    if source_type == "data":
+        return DataSource(env, q, 30 * math.pow(10, 6), result)
+    if source_type == "voice":
+        return VoiceSource(env, q, 800, 20 * math.pow(10, 6), result)
+    if source_type == "video-polling":
+        return VideoSource(env, q, 8000, burstiness, 30 * math.pow(10, 6), 0.001, result, event_driven=False)
+    if source_type == "video-event-driven":
+        return VideoSource(env, q, 8000, burstiness, 30 * math.pow(10, 6), 0.001, result, event_driven=True)
+    raise ValueError(f"Unknown source type: {source_type}")
+
+def measure(source_type, burstiness, horizon):
+    env = CountingEnvironment()
+    source = build_source(env, source_type, burstiness)
+    start_time = time.perf_counter()
+    env.run(until=horizon)
+    wall_time = time.perf_counter() - start_time
+    return {
+        "source": source_type,
+        "burstiness": burstiness,
+        "events": env.scheduled_events,
+        "events_per_sim_second": env.scheduled_events / horizon,
+        "packets": source.get_total_sent_packet(),
+        "wall_time": wall_time,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the simpy events scheduled per simulated second by each source type.")
+    parser.add_argument("--horizon", type=float, default=10.0, help="simulated seconds per measurement")
+    parser.add_argument("--burstiness", type=float, nargs="+", default=[1.0, 20.0, 100.0])
+    args = parser.parse_args()
+
+    print(f"{'source':<20}{'burstiness':>12}{'events':>12}{'events/sim s':>16}{'packets':>12}{'wall s':>10}")
+    for burstiness in args.burstiness:
+        for source_type in ["data", "voice", "video-polling", "video-event-driven"]:
+            row = measure(source_type, burstiness, args.horizon)
+            print(f"{row['source']:<20}{row['burstiness']:>12.1f}{row['events']:>12d}{row['events_per_sim_second']:>16.1f}{row['packets']:>12d}{row['wall_time']:>10.3f}")
+
+if __name__ == "__main__":
+    main()
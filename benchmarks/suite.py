@@ -0,0 +1,242 @@
+import argparse
+import concurrent.futures
+import json
+import math
+import multiprocessing
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+import exerciseMM1NForComparison as mm1n
+import loss_rate_estimation as lre
+import simulation_project as sp
+from benchmarks.event_kernel import create_backend
+
+# Every case runs in blocks until it has covered its horizon and its relative
+# confidence half-width has dropped below the threshold, or until the limit.
+# The project cases use the stopping rule of the model itself:
+# confidence_threshold checked every block_size once min_simulation_duration
+# has passed, up to max_simulation_duration. The default project cases loosen
+# that rule so the whole suite takes minutes; the full_* cases keep the
+# defaults of sp.Scenario() and take hours. --scale only shortens the
+# horizon; the run to the threshold is never cut short, so time to CI is
+# always that of a real run. Each case runs in a fresh process so that peak
+# RSS is its own.
+
+class LossBlocks(object):
+    # Loss fraction of every block, with the 4.5 s / sqrt(n) half-width used
+    # by the batch-means estimators of the models.
+    def __init__(self, counters):
+        self.counters = counters
+        self.last = (0, 0)
+        self.values = []
+
+    def confidence(self):
+        emissions, losses = self.counters()
+        block_emissions, block_losses = emissions - self.last[0], losses - self.last[1]
+        self.last = (emissions, losses)
+        if block_emissions > 0:
+            self.values.append(block_losses / block_emissions)
+        mean = np.mean(self.values) if self.values else 0.0
+        if len(self.values) <= 1 or mean <= 0:
+            return math.inf
+        return 4.5 * float(np.std(self.values, ddof=1)) / math.sqrt(len(self.values)) / mean
+
+def build_mm1n(env, seed):
+    np.random.seed(seed)
+    q = mm1n.queueClass(env, 10, 1.0)
+    ps1 = mm1n.poissonSource(env, 0.9, q)
+    blocks = LossBlocks(lambda: (ps1.nbEmissions, ps1.queueLosses))
+    return lambda: ps1.nbEmissions - ps1.queueLosses, blocks.confidence
+
+def build_loss_rate(env, seed):
+    np.random.seed(seed)
+    q = lre.queueClass(env, 10, 1.0)
+    lre.poissonSource(env, 0.1, q, 1, 1)
+    lre.poissonSource(env, 0.7, q, 2, 1)
+    blocks = LossBlocks(lambda: (q.packetReceivedTotal, q.packetLossTotal))
+    return lambda: q.packetReceivedTotal - q.packetLossTotal, blocks.confidence
+
+def project_case(burstiness, **parameters):
+    scenario = sp.Scenario(**parameters)
+
+    def build(env, seed):
+        sources, result = sp.create_model(env, burstiness, np.random.SeedSequence(seed), scenario=scenario)
+        estimators = list(sources.values()) + [result]
+        confidence = lambda: max(e.calculate_confidence_interval() / e.get_average_response_time() for e in estimators)
+        return result.get_total_processed_packet, confidence
+    return (build, 5.0, scenario.max_simulation_duration, scenario.block_size, scenario.confidence_threshold, scenario.min_simulation_duration)
+
+# Stopping rule of the default project cases.
+quick_project = {"confidence_threshold": 0.25, "min_simulation_duration": 50, "max_simulation_duration": 5000}
+
+# name: (build, horizon, limit, block size, relative half-width threshold,
+# time before the first check)
+cases = {
+    "mm1n": (build_mm1n, 200000.0, 2000000.0, 1000.0, 0.05, 0.0),
+    "loss_rate": (build_loss_rate, 200000.0, 2000000.0, 1000.0, 0.1, 0.0),
+    "project_b1": project_case(1.0, **quick_project),
+    "project_b20": project_case(20.0, **quick_project),
+    "project_b100": project_case(100.0, **quick_project),
+    "full_b1": project_case(1.0),
+    "full_b20": project_case(20.0),
+    "full_b100": project_case(100.0),
+}
+default_cases = ["mm1n", "loss_rate", "project_b1", "project_b20", "project_b100"]
+
+# Results of the default run (simpy backend, scale 1, seed 10, best of 3),
+# stored with the suite for run --baseline, and of the full_* cases (one run).
+baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+full_baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_full.json")
+
+# Metric: True when higher is better.
+metrics = {
+    "packets_per_second": True,
+    "events_per_second": True,
+    "peak_rss_mb": False,
+    "time_to_ci_wall": False,
+}
+
+def peak_rss_mb():
+    # VmHWM belongs to the address space and restarts at exec; ru_maxrss can
+    # carry the peak of the parent into a spawned child on Linux.
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def measure(name, backend, scale, seed):
+    build, horizon, limit, block_size, threshold, first_check = cases[name]
+    horizon = horizon * scale
+    env = create_backend(backend)
+    served_packets, confidence = build(env, seed)
+
+    time_to_ci = None
+    now = 0.0
+    start_time = time.perf_counter()
+    while now < limit and (now < horizon or time_to_ci is None):
+        now = min(now + block_size, limit)
+        env.run(until=now)
+        if time_to_ci is None and now >= first_check and confidence() < threshold:
+            time_to_ci = (time.perf_counter() - start_time, now)
+    wall_time = time.perf_counter() - start_time
+
+    return {
+        "backend": backend,
+        "simulated_time": now,
+        "wall_time": wall_time,
+        "packets": served_packets(),
+        "events": env.scheduled_events,
+        "packets_per_second": served_packets() / wall_time,
+        "events_per_second": env.scheduled_events / wall_time,
+        "peak_rss_mb": peak_rss_mb(),
+        "threshold": threshold,
+        "time_to_ci_wall": time_to_ci[0] if time_to_ci is not None else None,
+        "time_to_ci_simulated": time_to_ci[1] if time_to_ci is not None else None,
+    }
+
+def run_suite(names, backend="simpy", scale=1.0, seed=10, repeat=1):
+    # With repeat > 1 the fastest run of each case is kept, the least
+    # disturbed by the rest of the machine.
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for name in names:
+        runs = []
+        for _ in range(repeat):
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(measure, name, backend, scale, seed).result())
+        results[name] = min(runs, key=lambda run: run["wall_time"])
+    return {
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "numpy": np.__version__,
+                        "backend": backend, "scale": scale, "seed": seed, "repeat": repeat, "date": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "cases": results,
+    }
+
+def compare(baseline, current, tolerance=0.1):
+    # Rows of (case, metric, baseline, current, relative change, regressed);
+    # the change is signed so that a positive value is always an improvement.
+    rows = []
+    for name, values in current["cases"].items():
+        if name not in baseline["cases"]:
+            continue
+        for metric, higher_is_better in metrics.items():
+            old, new = baseline["cases"][name].get(metric), values.get(metric)
+            if old is None or new is None or old == 0:
+                regressed = old is not None and new is None
+                rows.append((name, metric, old, new, None, regressed))
+                continue
+            change = (new - old) / old if higher_is_better else (old - new) / old
+            rows.append((name, metric, old, new, change, change < -tolerance))
+    return rows
+
+def print_results(results):
+    print(f"{'case':<14}{'packets/s':>12}{'events/s':>12}{'peak RSS MB':>13}{'to CI wall s':>14}{'to CI sim':>12}{'wall s':>9}")
+    for name, row in results["cases"].items():
+        to_ci_wall = f"{row['time_to_ci_wall']:>14.2f}" if row["time_to_ci_wall"] is not None else f"{'not reached':>14}"
+        to_ci_simulated = f"{row['time_to_ci_simulated']:>12.1f}" if row["time_to_ci_simulated"] is not None else f"{'-':>12}"
+        peak = f"{row['peak_rss_mb']:>13.1f}" if row["peak_rss_mb"] is not None else f"{'-':>13}"
+        print(f"{name:<14}{row['packets_per_second']:>12.0f}{row['events_per_second']:>12.0f}{peak}{to_ci_wall}{to_ci_simulated}{row['wall_time']:>9.2f}")
+
+def print_comparison(rows, tolerance):
+    print(f"{'case':<14}{'metric':<20}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, metric, old, new, change, regressed in rows:
+        old_text = f"{old:>12.4g}" if old is not None else f"{'-':>12}"
+        new_text = f"{new:>12.4g}" if new is not None else f"{'-':>12}"
+        change_text = f"{change:>+9.1%}" if change is not None else f"{'':>9}"
+        print(f"{name:<14}{metric:<20}{old_text}{new_text}{change_text}{'  REGRESSION' if regressed else ''}")
+    regressions = sum(1 for row in rows if row[5])
+    print(f"{regressions} regression(s) beyond {tolerance:.0%}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the M/M/1/N, two-source loss-rate and Data/Voice/Video models, and compare against a baseline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the suite and write the results as JSON")
+    run_parser.add_argument("--cases", nargs="+", choices=list(cases), default=default_cases,
+                            help="cases to run (default: all but the full_* cases, which run the model to its default threshold and take hours)")
+    run_parser.add_argument("--backend", choices=["simpy", "kernel"], default="simpy")
+    run_parser.add_argument("--scale", type=float, default=1.0, help="multiplier applied to every throughput horizon (not to the run to the CI threshold)")
+    run_parser.add_argument("--seed", type=int, default=10)
+    run_parser.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest is kept")
+    run_parser.add_argument("--output", default="benchmark.json")
+    run_parser.add_argument("--baseline", nargs="?", const=baseline_path, default=None,
+                            help=f"compare against this results file (default {baseline_path}; {full_baseline_path} "
+                                 "holds the full_* cases) and exit 1 on a regression")
+    run_parser.add_argument("--tolerance", type=float, default=0.1, help="relative change counted as a regression")
+    compare_parser = subparsers.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run_suite(args.cases, args.backend, args.scale, args.seed, args.repeat)
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print_results(results)
+    else:
+        with open(args.current) as file:
+            results = json.load(file)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline["environment"].get("backend") != results["environment"].get("backend") or baseline["environment"].get("scale") != results["environment"].get("scale"):
+            print("Warning: baseline was run with another backend or scale")
+        if print_comparison(compare(baseline, results, args.tolerance), args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import time
+
+import numpy as np
+import simpy
+
+from simulation_project import DataSource, VideoSource, Result, VariateBuffer, data_rate, video_packet_size, video_rate, video_on_time_average
+from benchmarks.source_events import NullQueue
+
+def time_draws(buffer_size, count):
+    env = simpy.Environment()
+    source = DataSource(env, NullQueue(), data_rate, Result(env), rng=np.random.default_rng(1), buffer_size=buffer_size)
+    start_time = time.perf_counter()
+    if buffer_size:
+        variates = VariateBuffer(source.draw, buffer_size)
+        for _ in range(count):
+            packet_size, sending_time = variates.next()
+    else:
+        for _ in range(count):
+            packet_size = source.get_packet_size()
+            sending_time = source.rng.exponential(packet_size / source.rate)
+    return (time.perf_counter() - start_time) / count
+
+def time_source(source_class, buffer_size, horizon):
+    env = simpy.Environment()
+    if source_class is DataSource:
+        source = DataSource(env, NullQueue(), data_rate, Result(env), rng=np.random.default_rng(1), buffer_size=buffer_size)
+    else:
+        source = VideoSource(env, NullQueue(), video_packet_size, 100.0, video_rate, video_on_time_average, Result(env), rng=np.random.default_rng(1), buffer_size=buffer_size)
+    start_time = time.perf_counter()
+    env.run(until=horizon)
+    return (time.perf_counter() - start_time) / source.get_total_sent_packet()
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-packet cost of scalar versus buffered random variates.")
+    parser.add_argument("--count", type=int, default=1000000, help="packets drawn in the draw-only measurement")
+    parser.add_argument("--horizon", type=float, default=50.0, help="simulated seconds in the source measurement")
+    parser.add_argument("--buffer-size", type=int, nargs="+", default=[1024, 8192, 65536])
+    args = parser.parse_args()
+
+    print("Data packet variates only (size + interarrival):")
+    scalar = time_draws(None, args.count)
+    print(f"{'scalar':>12}: {scalar * 1e9:8.1f} ns/packet")
+    for buffer_size in args.buffer_size:
+        buffered = time_draws(buffer_size, args.count)
+        print(f"{buffer_size:>12}: {buffered * 1e9:8.1f} ns/packet ({scalar / buffered:.1f}x)")
+
+    print("Whole source process (simpy, null queue):")
+    for source_class in [DataSource, VideoSource]:
+        scalar = time_source(source_class, None, args.horizon)
+        buffered = time_source(source_class, args.buffer_size[-1], args.horizon)
+        print(f"{source_class.__name__:>12}: scalar {scalar * 1e9:8.1f} ns/packet, buffered {buffered * 1e9:8.1f} ns/packet ({scalar / buffered:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import json
+import os
+
+import numpy as np
+
+# Snapshots are nested dicts of scalars, arrays and strings, stored flat in an
+# uncompressed .npz with "/"-joined keys. Nothing is pickled: generator frames
+# and event calendars are rebuilt by the models from the saved wake-up times.
+
+def flatten(state, prefix=""):
+    arrays = {}
+    for key, value in state.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            arrays.update(flatten(value, name + "/"))
+        else:
+            arrays[name] = np.asarray(value)
+    return arrays
+
+def unflatten(arrays):
+    state = {}
+    for name, value in arrays.items():
+        *parents, key = name.split("/")
+        node = state
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[key] = value
+    return state
+
+def save_checkpoint(path, state):
+    # Written beside the target and renamed over it, so a crash while writing
+    # leaves the previous snapshot intact.
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, **flatten(state))
+    os.replace(temporary, path)
+
+def load_checkpoint(path):
+    with np.load(path) as data:
+        return unflatten({name: data[name] for name in data.files})
+
+def rng_state(rng):
+    return json.dumps(rng.bit_generator.state)
+
+def set_rng_state(rng, state):
+    rng.bit_generator.state = json.loads(str(state))
+
+def legacy_rng_state():
+    # State of the global np.random generator used by the exercise scripts.
+    _, key, position, has_gauss, cached_gaussian = np.random.get_state()
+    return {"key": key, "position": position, "has_gauss": has_gauss, "cached_gaussian": cached_gaussian}
+
+def set_legacy_rng_state(state):
+    np.random.set_state(("MT19937", state["key"], int(state["position"]), int(state["has_gauss"]), float(state["cached_gaussian"])))
+
+class Checkpoint(object):
+    def __init__(self, path, every=20):
+        self.path = path
+        self.every = every
+        self.blocks = 0
+        self.saved_blocks = 0
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def due(self):
+        # The last step ended on a multiple of every not saved yet.
+        return self.blocks % self.every == 0 and self.blocks != self.saved_blocks
+
+    def step(self, blocks):
+        # Blocks to wait out of the blocks left until the next stopping check,
+        # cut where the next snapshot falls due however far apart checks are.
+        step = min(blocks, self.every - self.blocks % self.every)
+        self.blocks += step
+        return step
+
+    def save(self, state):
+        save_checkpoint(self.path, state)
+        self.saved_blocks = self.blocks
+
+    def load(self):
+        return load_checkpoint(self.path)
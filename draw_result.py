@@ -1,55 +1,70 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+import argparse
 
-def plot_response_times(csv_file, min_burstiness, max_burstiness):
-    data = pd.read_csv(csv_file)
-    filtered_data = data[(data['burstiness'] >= min_burstiness) & (data['burstiness'] <= max_burstiness)]
-    
-    # Plot the response times
+def load_pyplot(output):
+    # Imported on first use; with an output file the non-interactive backend
+    # is selected so plots can be drawn on machines without a display.
+    import matplotlib
+    if output is not None:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+def finish_figure(plt, output):
+    if output is not None:
+        plt.savefig(output)
+        plt.close()
+    else:
+        plt.show()
+
+def read_results(path):
+    # Columnar exports of the result store (.npz) load without parsing text.
+    import pandas as pd
+
+    if path.endswith(".npz"):
+        from result_store import load_columns
+
+        return pd.DataFrame(load_columns(path))
+    return pd.read_csv(path)
+
+def draw_response_times(plt, data, bands=None):
+    # data maps column names to the values of one burstiness range (a frame or
+    # a dict of arrays); bands optionally maps a column to its (lower, upper)
+    # confidence band.
     plt.figure(figsize=(10, 6))
     
-    plt.plot(filtered_data['burstiness'], filtered_data['data_response_time'], label='Data Response Time', marker='o')
-    plt.plot(filtered_data['burstiness'], filtered_data['voice_response_time'], label='Voice Response Time', marker='o')
-    plt.plot(filtered_data['burstiness'], filtered_data['video_response_time'], label='Video Response Time', marker='o')
-    plt.plot(filtered_data['burstiness'], filtered_data['total_response_time'], label='Total Response Time', marker='o')
+    for column, label in [('data_response_time', 'Data Response Time'), ('voice_response_time', 'Voice Response Time'),
+                          ('video_response_time', 'Video Response Time'), ('total_response_time', 'Total Response Time')]:
+        line, = plt.plot(data['burstiness'], data[column], label=label, marker='o')
+        if bands is not None and column in bands:
+            plt.fill_between(data['burstiness'], bands[column][0], bands[column][1], color=line.get_color(), alpha=0.2)
     
     # Customize the plot
     plt.title('Response Time')
     plt.xlabel('Burstiness')
     plt.ylabel('Average Response Time')
-    plt.xticks(filtered_data['burstiness'])
+    plt.xticks(data['burstiness'])
     plt.legend()
     plt.grid(True)
-    
-    # Show the plot
     plt.tight_layout()
-    plt.show()
-
-def plot_sent_packet_proportion(csv_file, min_burstiness, max_burstiness):
-    data = pd.read_csv(csv_file)
-
-    filtered_data = data[(data['burstiness'] >= min_burstiness) & (data['burstiness'] <= max_burstiness)]
 
+def draw_sent_packet_proportion(plt, data, min_burstiness, max_burstiness):
     # Calculate percentage contribution for each source
-    filtered_data['data_percentage'] = filtered_data['data_sent_packet'] / filtered_data['total_sent_packet'] * 100
-    filtered_data['voice_percentage'] = filtered_data['voice_sent_packet'] / filtered_data['total_sent_packet'] * 100
-    filtered_data['video_percentage'] = filtered_data['video_sent_packet'] / filtered_data['total_sent_packet'] * 100
+    data_percentage = data['data_sent_packet'] / data['total_sent_packet'] * 100
+    voice_percentage = data['voice_sent_packet'] / data['total_sent_packet'] * 100
+    video_percentage = data['video_sent_packet'] / data['total_sent_packet'] * 100
 
     # Plot the stacked bar chart
     plt.figure(figsize=(10, 6))
     
-    x = filtered_data['burstiness']
+    x = data['burstiness']
     
     # Set a fixed bar width
     bar_width = (max_burstiness - min_burstiness) / (len(x) * 2) # You can adjust this value between 0 and 1
     
     # Stack the bars with fixed width
-    plt.bar(x, filtered_data['data_percentage'], width=bar_width, label='Data')
-    plt.bar(x, filtered_data['voice_percentage'], width=bar_width,
-            bottom=filtered_data['data_percentage'], label='Voice')
-    plt.bar(x, filtered_data['video_percentage'], width=bar_width,
-            bottom=filtered_data['data_percentage'] + filtered_data['voice_percentage'], 
-            label='Video')
+    plt.bar(x, data_percentage, width=bar_width, label='Data')
+    plt.bar(x, voice_percentage, width=bar_width, bottom=data_percentage, label='Voice')
+    plt.bar(x, video_percentage, width=bar_width, bottom=data_percentage + voice_percentage, label='Video')
 
     # Add labels, title, and legend
     plt.title('Proportion of Sent Packets by Source')
@@ -57,26 +72,41 @@ def plot_sent_packet_proportion(csv_file, min_burstiness, max_burstiness):
     plt.ylabel('Percentage of Sent Packets')
     plt.xticks(x)
     plt.legend()
-
     plt.tight_layout()
-    plt.show()
+
+def plot_response_times(csv_file, min_burstiness, max_burstiness, output=None):
+    plt = load_pyplot(output)
+    data = read_results(csv_file)
+    draw_response_times(plt, data[(data['burstiness'] >= min_burstiness) & (data['burstiness'] <= max_burstiness)])
+    finish_figure(plt, output)
+
+def plot_sent_packet_proportion(csv_file, min_burstiness, max_burstiness, output=None):
+    plt = load_pyplot(output)
+    data = read_results(csv_file)
+    draw_sent_packet_proportion(plt, data[(data['burstiness'] >= min_burstiness) & (data['burstiness'] <= max_burstiness)], min_burstiness, max_burstiness)
+    finish_figure(plt, output)
 
 def calculate_slope(csv_file):
-    data = pd.read_csv(csv_file)
-    
-    data_slope = data['data_response_time'].diff() / data['burstiness'].diff()
-    print(f'Data Slope: {data_slope.mean() * 1000}')
-    
-    voice_slope = data['voice_response_time'].diff() / data['burstiness'].diff()
-    print(f'Voice Slope: {voice_slope.mean() * 1000}')
-    
-    video_slope = data['video_response_time'].diff() / data['burstiness'].diff()
-    print(f'Video Slope: {video_slope.mean() * 1000}')
-    
-    total_slope = data['total_response_time'].diff() / data['burstiness'].diff()
-    print(f'Total Slope: {total_slope.mean() * 1000}')
+    from analysis import slopes
+
+    for source, slope in slopes(csv_file).items():
+        print(f'{source.capitalize()} Slope: {slope}')
     
-#plot_sent_packet_proportion("data_full.csv", 10, 100)
-#plot_response_times("data_full.csv", 10, 100)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plot or summarize the results of a burstiness sweep.")
+    parser.add_argument("command", choices=["response-times", "sent-packets", "slope"])
+    parser.add_argument("csv_file", nargs="?", default="data_100.csv", help="sweep results, CSV or a result-store export (.npz)")
+    parser.add_argument("--min-burstiness", type=float, default=10)
+    parser.add_argument("--max-burstiness", type=float, default=100)
+    parser.add_argument("--output", default=None, help="save the figure to this file instead of showing it")
+    args = parser.parse_args(argv)
+
+    if args.command == "response-times":
+        plot_response_times(args.csv_file, args.min_burstiness, args.max_burstiness, args.output)
+    elif args.command == "sent-packets":
+        plot_sent_packet_proportion(args.csv_file, args.min_burstiness, args.max_burstiness, args.output)
+    else:
+        calculate_slope(args.csv_file)
 
-calculate_slope("data_100.csv")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
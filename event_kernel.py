@@ -0,0 +1,128 @@
+import heapq
+import math
+
+URGENT, NORMAL = 0, 1
+
+class StopSimulation(Exception):
+    pass
+
+class Event(object):
+    # Subset of simpy.Event: processes wait on it, succeed() resumes them at
+    # the current time. callbacks is None once the event has been processed.
+    __slots__ = ("env", "callbacks", "value", "triggered")
+
+    def __init__(self, env):
+        self.env = env
+        self.callbacks = []
+        self.value = None
+        self.triggered = False
+
+    def succeed(self, value=None):
+        if self.triggered:
+            raise RuntimeError(f"{self} has already been triggered")
+        self.triggered = True
+        self.value = value
+        self.env.schedule(self.env.now, NORMAL, self.fire, value)
+        return self
+
+    def fire(self, value):
+        callbacks, self.callbacks = self.callbacks, None
+        for callback in callbacks:
+            callback(value)
+
+class Timeout(object):
+    # Not an Event: a timeout is only ever yielded by the process that created
+    # it, so the process schedules its own resumption and no callback list is built.
+    __slots__ = ("time", "value")
+
+    def __init__(self, time, value):
+        self.time = time
+        self.value = value
+
+class Process(Event):
+    __slots__ = ("generator",)
+
+    def __init__(self, env, generator):
+        super().__init__(env)
+        self.generator = generator
+        env.schedule(env.now, URGENT, self.resume, None)
+
+    def resume(self, value):
+        try:
+            target = self.generator.send(value)
+        except StopIteration as stop:
+            self.succeed(stop.value)
+            return
+
+        env = self.env
+        if type(target) is Timeout:
+            env.scheduled_events += 1
+            heapq.heappush(env.queue, (target.time, NORMAL, env.scheduled_events, self.resume, target.value))
+        elif target.callbacks is None:
+            env.schedule(env.now, NORMAL, self.resume, target.value)
+        else:
+            target.callbacks.append(self.resume)
+
+class Environment(object):
+    # Event calendar kept as a binary heap of (time, priority, seq, callback,
+    # value) tuples. Exposes the part of simpy.Environment the models use:
+    # now, timeout, event, process and run(until=time or event).
+    def __init__(self, initial_time=0):
+        self.now = initial_time
+        self.queue = []
+        self.scheduled_events = 0
+
+    def schedule(self, time, priority, callback, value):
+        self.scheduled_events += 1
+        heapq.heappush(self.queue, (time, priority, self.scheduled_events, callback, value))
+
+    def timeout(self, delay, value=None):
+        if delay < 0:
+            raise ValueError(f"Negative delay {delay}")
+        return Timeout(self.now + delay, value)
+
+    def event(self):
+        return Event(self)
+
+    def process(self, generator):
+        return Process(self, generator)
+
+    def run(self, until=None):
+        # Like simpy, events scheduled exactly at the until time are left in
+        # the calendar and now is set to until.
+        limit = math.inf
+        if isinstance(until, Event):
+            if until.callbacks is None:
+                return until.value
+            until.callbacks.append(self.stop)
+        elif until is not None:
+            if until <= self.now:
+                raise ValueError(f"until ({until}) must be greater than the current time ({self.now})")
+            limit = until
+
+        queue = self.queue
+        pop = heapq.heappop
+        try:
+            while queue and queue[0][0] < limit:
+                time, _, _, callback, value = pop(queue)
+                self.now = time
+                callback(value)
+        except StopSimulation:
+            return until.value
+
+        if isinstance(until, Event):
+            raise RuntimeError(f"No scheduled events left but {until} was not triggered")
+        if until is not None:
+            self.now = limit
+
+    def stop(self, value):
+        raise StopSimulation()
+
+def create_environment(backend="simpy", initial_time=0):
+    if backend == "simpy":
+        import simpy
+
+        return simpy.Environment(initial_time)
+    if backend == "kernel":
+        return Environment(initial_time)
+    raise ValueError(f"Unknown backend: {backend}")
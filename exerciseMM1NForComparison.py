@@ -2,20 +2,24 @@ import sys
 import numpy as np
 import random
 import time
-import simpy
 
+from event_kernel import create_environment
 
-simulationDuration =  10000000.0
 
-np.random.seed(10)
+simulationDuration =  10000000.0
+backend = "simpy"   #or "kernel" for the lean event calendar of event_kernel.py
 
 class queueClass(object):   #a queue class is a buffer + a server
-    def __init__(self, env, queueCapa, serviceRate):
+    def __init__(self, env, queueCapa, serviceRate, persistentServer=True):
         self.env = env
         self.inService = 0
         self.queueLength = 0
         self.queueCapacity = queueCapa
         self.serviceRate = serviceRate
+        self.persistentServer = persistentServer
+        self.wakeUp = None
+        if persistentServer:
+            self.server = env.process(self.serve())
 
     def service(self):
         self.inService = 1
@@ -26,11 +30,26 @@ class queueClass(object):   #a queue class is a buffer + a server
         else:
             self.inService = 0
 
+    def serve(self):   #one server process parked on wakeUp while the queue is empty
+        while True:
+            if self.queueLength == 0:
+                self.inService = 0
+                self.wakeUp = self.env.event()
+                yield self.wakeUp
+            self.inService = 1
+            yield self.env.timeout(np.random.exponential(1.0/self.serviceRate))
+            self.queueLength -= 1
+
     def reception(self,source):
         if self.queueLength + 1 <= self.queueCapacity:    
             self.queueLength += 1
             if self.inService == 0: 
-                self.env.process(self.service())
+                if not self.persistentServer:
+                    self.env.process(self.service())
+                elif self.wakeUp is not None:
+                    self.inService = 1
+                    self.wakeUp.succeed()
+                    self.wakeUp = None
         else:
             source.queueLosses += 1
 
@@ -51,19 +70,21 @@ class poissonSource(object):
                 self.q.reception(self)
                 
 
-start_time = time.time()
+if __name__ == "__main__":
+    np.random.seed(10)
+    start_time = time.time()
 
-env = simpy.Environment()
+    env = create_environment(backend)
 
-q = queueClass(env,10,1.0)
-ps1 = poissonSource(env,0.9,q)
+    q = queueClass(env,10,1.0)
+    ps1 = poissonSource(env,0.9,q)
 
 
-env.run(until=simulationDuration)
+    env.run(until=simulationDuration)
 
-end_time = time.time()
+    end_time = time.time()
 
-print("(physical) duration of the simulation:", end_time - start_time)
-print("Loss rate:",ps1.queueLosses*1.0/ps1.nbEmissions)
+    print("(physical) duration of the simulation:", end_time - start_time)
+    print("Loss rate:",ps1.queueLosses*1.0/ps1.nbEmissions)
 
 
@@ -0,0 +1,80 @@
+import argparse
+import json
+
+import numpy as np
+
+import simulation_project as sp
+from event_kernel import create_environment
+from rate_schedule import create_schedule
+
+# One run of the model under a load profile, recording the response time of
+# every class window by window: each operating point of the profile is
+# reached from the state the previous one left, without a fresh warm-up.
+
+def run_profile(schedule, duration, window, burstiness=40.0, seed=None, backend="simpy", scenario=None):
+    schedule = create_schedule(schedule)
+    values = scenario.to_dict() if scenario is not None else {}
+    values["rate_schedule"] = schedule.to_dict()
+    scenario = sp.Scenario(**values)
+    env = create_environment(backend)
+    sources, result = sp.create_model(env, burstiness, np.random.SeedSequence(seed), scenario=scenario)
+    series = sp.ResponseTimeSeries(env, sources, result, window, schedule)
+    env.run(until=duration)
+    series.flush()
+    return series
+
+def plot_series(frame, output=None):
+    from draw_result import finish_figure, load_pyplot
+
+    plt = load_pyplot(output)
+    figure, (response_axis, factor_axis) = plt.subplots(2, 1, sharex=True, figsize=(10, 7), gridspec_kw={"height_ratios": [3, 1]})
+    for name, rows in frame.groupby("source", observed=True):
+        response_axis.plot(rows["start"], rows["response_time"], label=name)
+    response_axis.set_ylabel("Mean response time")
+    response_axis.legend()
+    response_axis.grid(True)
+    factors = frame.drop_duplicates("start")
+    factor_axis.step(factors["start"], factors["factor"], where="post")
+    factor_axis.set_xlabel("Time")
+    factor_axis.set_ylabel("Load factor")
+    factor_axis.grid(True)
+    figure.tight_layout()
+    finish_figure(plt, output)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Data/Voice/Video model under a time-varying load and record windowed response times.")
+    parser.add_argument("--profile", choices=["ramp", "diurnal"], default="ramp")
+    parser.add_argument("--low", type=float, default=0.5, help="lowest load factor (start of a ramp)")
+    parser.add_argument("--high", type=float, default=1.5, help="highest load factor (end of a ramp)")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--period", type=float, default=None, help="length of the ramp or of one day (default: the duration)")
+    parser.add_argument("--schedule", default=None, help='explicit schedule as JSON, e.g. {"times": [0, 50], "factors": [0.5, 1.2]}; overrides --profile')
+    parser.add_argument("--duration", type=float, default=100.0)
+    parser.add_argument("--window", type=float, default=1.0)
+    parser.add_argument("--burstiness", type=float, default=40.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--backend", choices=["simpy", "kernel"], default="simpy")
+    parser.add_argument("--output", default="load_profile.csv")
+    parser.add_argument("--plot", default=None, help="save a figure of the series to this file")
+    args = parser.parse_args(argv)
+
+    period = args.period if args.period is not None else args.duration
+    if args.schedule is not None:
+        schedule = json.loads(args.schedule)
+    elif args.profile == "ramp":
+        schedule = {"profile": "ramp", "start_factor": args.low, "end_factor": args.high, "duration": period, "steps": args.steps}
+    else:
+        schedule = {"profile": "diurnal", "low": args.low, "high": args.high, "period": period, "steps": args.steps}
+
+    series = run_profile(schedule, args.duration, args.window, args.burstiness, args.seed, args.backend)
+    frame = series.df
+    frame.to_csv(args.output, index=False)
+    total = frame[frame["source"] == "Total"]
+    print(f"{len(total)} windows of {args.window:g} written to {args.output}")
+    for factor, rows in total.groupby(total["factor"].round(9)):
+        print(f"factor {factor:.3f}: mean response time {rows['response_time'].mean():.6g} over {len(rows)} windows")
+    if args.plot:
+        plot_series(frame, args.plot)
+
+if __name__ == "__main__":
+    main()
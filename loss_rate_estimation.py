@@ -1,52 +1,49 @@
+import argparse
+import os
 import sys
 import numpy as np
 import random
-import matplotlib
-import matplotlib.pyplot as plt
-from matplotlib import colors
 import math
+import tempfile
 
-import pandas as pd
-import simpy
-
-import queue
+from packet_ring import PacketRing
+from metrics_recorder import ColumnRecorder
+from batch_means import BatchMeans
+from event_kernel import create_environment
+from checkpoint import save_checkpoint, load_checkpoint, legacy_rng_state, set_legacy_rng_state
 
 simulation_duration = 10000000
+backend = "simpy"   # or "kernel" for the lean event calendar of event_kernel.py
 periodPrintLR = 100
-df_lossRates = pd.DataFrame(columns=['sourceId', 'time', 'lossRate'])
 
 torque = math.sqrt(simulation_duration)
 
-np.random.seed(10)
+def newLossRateRecorder(spillDir=None):
+    # With spillDir, full chunks of the series go to disk and memory stays at one chunk.
+    return ColumnRecorder({'sourceId': 'category', 'time': 'f8', 'lossRate': 'f8'}, spill_dir=spillDir, prefix="lossRates")
 
 def printLossRate(env, source):
-    global df_lossRates
     source.cpterPrintLR += 1
     if source.cpterPrintLR == periodPrintLR:
         source.cpterPrintLR = 0
         #print("loss", env.now, source.ident, source.queueLosses/source.nbEmmissions)
-        df_lossRates.loc[len(df_lossRates)] = {'sourceId':source.ident, 'time':env.now, 'lossRate': source.queueLosses/source.nbEmmissions}
+        source.q.recorder.append(source.ident, env.now, source.queueLosses/source.nbEmmissions)
 
 def printConfidenceInterval(queue):
-    standardDeviation = math.sqrt((1 / (queue.intervalCount - 1)) * (queue.zSquare - ((queue.z ** 2) / queue.intervalCount)))
-    epsilonTorque = 4.5 * standardDeviation
-    epsilonTotal = epsilonTorque * math.sqrt(torque / queue.env.now)
+    epsilonTotal = queue.lossEstimator.half_width(queue.env.now)
     lossRate = queue.packetLossTotal / queue.packetReceivedTotal
 
-    df_lossRates.loc[len(df_lossRates)] = {'sourceId': 'ConfidenceIntervalUp', 'time': queue.env.now, 'lossRate': epsilonTotal + lossRate}
-    df_lossRates.loc[len(df_lossRates)] = {'sourceId': 'ConfidenceIntervalDown', 'time': queue.env.now, 'lossRate': lossRate - epsilonTotal}
-
-class packet(object):
-    def __init__(self, t, ident, pktSize):
-        self.t = t
-        self.ident = ident
-        self.pktSize = pktSize
+    queue.recorder.append('ConfidenceIntervalUp', queue.env.now, epsilonTotal + lossRate)
+    queue.recorder.append('ConfidenceIntervalDown', queue.env.now, lossRate - epsilonTotal)
 
 class queueClass(object):
-    def __init__(self, env, queueCapa, serviceRate):
+    def __init__(self, env, queueCapa, serviceRate, persistentServer=True, blockLength=torque, recorder=None):
         self.env = env
+        self.recorder = recorder if recorder is not None else newLossRateRecorder()
         self.inService = 0
-        self.buffer = queue.Queue(maxsize=queueCapa)
+        self.persistentServer = persistentServer
+        self.wakeUp = None
+        self.buffer = PacketRing(queueCapa, bounded=True)
         self.queueLength = 0
         self.queueCapacity = queueCapa
         self.serviceRate = serviceRate
@@ -54,52 +51,83 @@ class queueClass(object):
         self.cpterPrintLR = 0
         self.packetReceivedTotal = 0
         self.packetLossTotal = 0
-        self.packetReceivedBlock = 0
-        self.packetLossBlock = 0 
-        self.intervalCount = 0
-        self.z = 0  
-        self.zSquare = 0
+        self.lossEstimator = BatchMeans(blockLength)
+        self.serviceEnd = None
+        if persistentServer:
+            self.server = env.process(self.serve())
 
     def service(self):
-        p = self.buffer.get()
-        self.queueLength -= p.pktSize
+        _, pktSize, _ = self.buffer.get()
+        self.queueLength -= pktSize
         service_time = np.random.exponential(scale=1/self.serviceRate)
         yield self.env.timeout(service_time)
         #print('Process packet at: %d' % self.env.now)
-        del p
         if self.queueLength > 0:
             self.env.process(self.service())
         else:
             self.inService = 0
 
-    def reception(self, source, pkt):
+    def serve(self):
+        if self.serviceEnd is not None:   # restored from a checkpoint in the middle of a service
+            yield self.env.timeout(self.serviceEnd - self.env.now)
+            self.serviceEnd = None
+
+        while True:
+            if self.queueLength == 0:
+                self.inService = 0
+                self.wakeUp = self.env.event()
+                yield self.wakeUp
+
+            _, pktSize, _ = self.buffer.get()
+            self.queueLength -= pktSize
+            service_time = np.random.exponential(scale=1/self.serviceRate)
+            self.serviceEnd = self.env.now + service_time
+            yield self.env.timeout(service_time)
+            self.serviceEnd = None
+
+    def reception(self, source):
         self.packetReceivedTotal += 1
 
-        if  (self.env.now - torque * self.intervalCount) > torque:
-            newZi = self.packetLossBlock / self.packetReceivedBlock
-            self.z += newZi
-            self.zSquare += newZi ** 2
-            self.packetReceivedBlock = 0
-            self.packetLossBlock = 0
-            self.intervalCount += 1
-            if self.intervalCount > 1:
-                printConfidenceInterval(self)
-                
-
-        self.packetReceivedBlock += 1
-
-        if self.queueLength + pkt.pktSize <= self.queueCapacity:
-            self.queueLength += pkt.pktSize
-            self.buffer.put(pkt)
+        lost = self.queueLength + source.pktSize > self.queueCapacity
+        intervalCount = self.lossEstimator.count
+        self.lossEstimator.add(self.env.now, 1 if lost else 0)
+        if self.lossEstimator.count != intervalCount and self.lossEstimator.count > 1:
+            printConfidenceInterval(self)
+
+        if not lost:
+            self.queueLength += source.pktSize
+            self.buffer.put(self.env.now, source.pktSize, source.ident)
             if self.inService == 0:
                 self.inService = 1
-                self.env.process(self.service())
+                if not self.persistentServer:
+                    self.env.process(self.service())
+                elif self.wakeUp is not None:
+                    self.wakeUp.succeed()
+                    self.wakeUp = None
         else:
             source.queueLosses += 1
             self.packetLossTotal += 1
-            self.packetLossBlock += 1
             printLossRate(self.env, source)
 
+    def getState(self):
+        if not self.persistentServer:
+            raise ValueError("Checkpoints need the persistent server process")
+        enterTime, pktSize, sourceId = self.buffer.snapshot()
+        return {"enterTime": enterTime, "pktSize": pktSize, "sourceId": sourceId, "queueLength": self.queueLength,
+                "serviceEnd": self.serviceEnd if self.serviceEnd is not None else math.nan,
+                "packetReceivedTotal": self.packetReceivedTotal, "packetLossTotal": self.packetLossTotal,
+                "lossEstimator": self.lossEstimator.get_state()}
+
+    def setState(self, state):
+        self.buffer.restore(state["enterTime"].tolist(), state["pktSize"].tolist(), state["sourceId"].tolist())
+        self.queueLength = int(state["queueLength"])
+        if not math.isnan(state["serviceEnd"]):
+            self.serviceEnd = float(state["serviceEnd"])
+            self.inService = 1
+        self.packetReceivedTotal = int(state["packetReceivedTotal"])
+        self.packetLossTotal = int(state["packetLossTotal"])
+        self.lossEstimator.set_state(state["lossEstimator"])
+
 class poissonSource(object):
     def __init__(self, env, rate, q, ident, pktSize):
         self.env = env
@@ -110,33 +138,196 @@ class poissonSource(object):
         self.nbEmmissions = 0
         self.queueLosses = 0
         self.cpterPrintLR = 0
+        self.nextEmission = None
         self.action = env.process(self.run())
     
     def run(self):
+        if self.nextEmission is not None:   # restored from a checkpoint
+            yield self.env.timeout(self.nextEmission - self.env.now)
+            self.nbEmmissions += 1
+            self.q.reception(self)
+
         while True:
             sending_time = np.random.exponential(scale=1/self.rate)
+            self.nextEmission = self.env.now + sending_time
             yield self.env.timeout(sending_time)
             #print('Send packet at: %d' % self.env.now)
             self.nbEmmissions += 1
-            p = packet(self.env.now, self.ident, self.pktSize)
-            q.reception(self, p)
-
-env = simpy.Environment()
-
-q = queueClass(env, 10, 1.0)
-ps1 = poissonSource(env, 0.1, q, 1, 1)
-ps2 = poissonSource(env, 0.7, q, 2, 1)
-
-env.run(until=simulation_duration)
-
-plt.plot(df_lossRates[df_lossRates['sourceId'] == 1]['time'], df_lossRates[df_lossRates['sourceId'] == 1]['lossRate'], linewidth=1, label='Source 1')
-plt.plot(df_lossRates[df_lossRates['sourceId'] == 2]['time'], df_lossRates[df_lossRates['sourceId'] == 2]['lossRate'], linewidth=1, label='Source 2')
-plt.plot(df_lossRates[df_lossRates['sourceId'] == 'ConfidenceIntervalUp']['time'], df_lossRates[df_lossRates['sourceId'] == 'ConfidenceIntervalUp']['lossRate'], linewidth=1, label='Confidence Interval Up')
-plt.plot(df_lossRates[df_lossRates['sourceId'] == 'ConfidenceIntervalDown']['time'], df_lossRates[df_lossRates['sourceId'] == 'ConfidenceIntervalDown']['lossRate'], linewidth=1, label='Confidence Interval Down')
-plt.grid(True, which='both', linestyle='dotted')
-plt.ylim(ymin=0)
-plt.ylabel('Loss rate')
-plt.xlabel('Time units')
-plt.title('Loss rate in function of the time')
-plt.legend()
-plt.show()
\ No newline at end of file
+            self.q.reception(self)
+
+    def getState(self):
+        return {"nbEmmissions": self.nbEmmissions, "queueLosses": self.queueLosses, "cpterPrintLR": self.cpterPrintLR, "nextEmission": self.nextEmission}
+
+    def setState(self, state):
+        self.nbEmmissions = int(state["nbEmmissions"])
+        self.queueLosses = int(state["queueLosses"])
+        self.cpterPrintLR = int(state["cpterPrintLR"])
+        self.nextEmission = float(state["nextEmission"])
+
+def saveCheckpoint(path, env, q, sources):
+    save_checkpoint(path, {"now": env.now, "queue": q.getState(), "sources": {str(source.ident): source.getState() for source in sources},
+                           "random": legacy_rng_state(), "lossRates": q.recorder.get_state()})
+
+def restoreCheckpoint(state, q, sources):
+    q.setState(state["queue"])
+    for source in sources:
+        source.setState(state["sources"][str(source.ident)])
+    set_legacy_rng_state(state["random"])
+    q.recorder.set_state(state["lossRates"])
+
+def checkpointing(env, q, sources, path, period):
+    while True:
+        yield env.timeout(period)
+        saveCheckpoint(path, env, q, sources)
+
+def simulateLossRate(duration=simulation_duration, queueCapa=10, serviceRate=1.0, rates=(0.1, 0.7), pktSize=1, seed=10,
+                     backend=backend, checkpointPath=None, checkpointEvery=100, resume=False, spillDir=None):
+    # Sources are numbered from 1 in the order of rates. Batch-means blocks last
+    # sqrt(duration) time units and checkpointEvery counts them.
+    blockLength = math.sqrt(duration)
+    state = load_checkpoint(checkpointPath) if resume and checkpointPath and os.path.exists(checkpointPath) else None
+    np.random.seed(seed)
+    env = create_environment(backend, float(state["now"]) if state is not None else 0)
+
+    q = queueClass(env, queueCapa, serviceRate, blockLength=blockLength, recorder=newLossRateRecorder(spillDir))
+    sources = [poissonSource(env, rate, q, ident, pktSize) for ident, rate in enumerate(rates, start=1)]
+    if state is not None:
+        restoreCheckpoint(state, q, sources)
+    if checkpointPath:
+        env.process(checkpointing(env, q, sources, checkpointPath, checkpointEvery * blockLength))
+
+    env.run(until=duration)
+    return q, sources
+
+def lossCycles(rng, rates, serviceRate, systemCapacity, cycles, twisted):
+    # Regenerative cycles of the embedded jump chain of queueClass, run in
+    # lockstep: a cycle starts with an emission into the empty queue and ends
+    # when it empties again. With twisted=True emission and service rates are
+    # swapped until the queue first fills, the usual change of measure for
+    # M/M/1/N overflow, and every loss counts with the likelihood ratio of its
+    # path. Returns emissions and (weighted) losses per cycle and source.
+    rates = np.asarray(rates, dtype=float)
+    totalRate = rates.sum()
+    shares = np.cumsum(rates / totalRate)
+    plainArrival = totalRate / (totalRate + serviceRate)
+    emissions = np.zeros((cycles, len(rates)))
+    losses = np.zeros((cycles, len(rates)))
+    weight = np.ones(cycles)
+    twisting = np.full(cycles, twisted and systemCapacity > 1)
+
+    # Both measures agree in the empty queue, where only emissions happen.
+    first = np.minimum(np.searchsorted(shares, rng.random(cycles), side="right"), len(rates) - 1)
+    emissions[np.arange(cycles), first] += 1
+    inSystem = np.ones(cycles, dtype=np.int64)
+    active = np.arange(cycles)
+    while active.size:
+        activeTwisting = twisting[active]
+        arrival = rng.random(active.size) < np.where(activeTwisting, 1 - plainArrival, plainArrival)
+        source = np.minimum(np.searchsorted(shares, rng.random(active.size), side="right"), len(rates) - 1)
+        ratio = np.where(arrival, totalRate / serviceRate, serviceRate / totalRate)
+        weight[active] = np.where(activeTwisting, weight[active] * ratio, weight[active])
+
+        full = inSystem[active] >= systemCapacity
+        emissions[active[arrival], source[arrival]] += 1
+        lost = arrival & full
+        losses[active[lost], source[lost]] += weight[active[lost]]
+        inSystem[active[arrival & ~full]] += 1
+        inSystem[active[~arrival]] -= 1
+        twisting[active[inSystem[active] >= systemCapacity]] = False
+        active = active[inSystem[active] > 0]
+    return emissions, losses
+
+def importanceSamplingLossRate(queueCapa=10, serviceRate=1.0, rates=(0.1, 0.7), pktSize=1, seed=10, precision=0.1,
+                               batchCycles=10000, maxCycles=10**7):
+    # Per-source loss rate E[losses per cycle] / E[emissions per cycle] by
+    # renewal-reward, the losses from twisted cycles and the emissions from
+    # independent plain ones. Batches of cycles are added until every source
+    # has epsilon / loss rate <= precision (Results/rules.txt) or maxCycles.
+    # Returns {ident: (loss rate, half width)} and the cycles per measure.
+    if sum(rates) >= serviceRate:
+        raise ValueError("Importance sampling targets rare losses: the total rate must be below the service rate")
+    systemCapacity = queueCapa // pktSize + 1   # waiting room plus the packet in service
+    rng = np.random.default_rng(seed)
+    lossSums = np.zeros((2, len(rates)))   # sum and sum of squares
+    emissionSums = np.zeros((2, len(rates)))
+    cycles = 0
+    while True:
+        losses = lossCycles(rng, rates, serviceRate, systemCapacity, batchCycles, True)[1]
+        emissions = lossCycles(rng, rates, serviceRate, systemCapacity, batchCycles, False)[0]
+        lossSums += [losses.sum(axis=0), (losses ** 2).sum(axis=0)]
+        emissionSums += [emissions.sum(axis=0), (emissions ** 2).sum(axis=0)]
+        cycles += batchCycles
+
+        meanLosses, meanEmissions = lossSums[0] / cycles, emissionSums[0] / cycles
+        varLosses = (lossSums[1] - cycles * meanLosses ** 2) / (cycles - 1)
+        varEmissions = (emissionSums[1] - cycles * meanEmissions ** 2) / (cycles - 1)
+        lossRates = meanLosses / meanEmissions
+        halfWidths = 4.5 * np.sqrt((varLosses + lossRates ** 2 * varEmissions) / cycles) / meanEmissions
+        if np.all((lossRates > 0) & (halfWidths <= precision * lossRates)) or cycles >= maxCycles:
+            break
+    return {i + 1: (float(lossRates[i]), float(halfWidths[i])) for i in range(len(rates))}, cycles
+
+def plotLossRates(df_lossRates, sourceIds, output=None):
+    from draw_result import load_pyplot, finish_figure
+
+    plt = load_pyplot(output)
+    for sourceId in sourceIds:
+        plt.plot(df_lossRates[df_lossRates['sourceId'] == sourceId]['time'], df_lossRates[df_lossRates['sourceId'] == sourceId]['lossRate'], linewidth=1, label=f'Source {sourceId}')
+    plt.plot(df_lossRates[df_lossRates['sourceId'] == 'ConfidenceIntervalUp']['time'], df_lossRates[df_lossRates['sourceId'] == 'ConfidenceIntervalUp']['lossRate'], linewidth=1, label='Confidence Interval Up')
+    plt.plot(df_lossRates[df_lossRates['sourceId'] == 'ConfidenceIntervalDown']['time'], df_lossRates[df_lossRates['sourceId'] == 'ConfidenceIntervalDown']['lossRate'], linewidth=1, label='Confidence Interval Down')
+    plt.grid(True, which='both', linestyle='dotted')
+    plt.ylim(ymin=0)
+    plt.ylabel('Loss rate')
+    plt.xlabel('Time units')
+    plt.title('Loss rate in function of the time')
+    plt.legend()
+    finish_figure(plt, output)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate the loss rate of Poisson sources sharing a finite queue.")
+    parser.add_argument("--duration", type=float, default=simulation_duration)
+    parser.add_argument("--queue-capacity", type=int, default=10, help="waiting room, on top of the packet in service")
+    parser.add_argument("--service-rate", type=float, default=1.0)
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.1, 0.7], help="emission rate of every source")
+    parser.add_argument("--seed", type=int, default=10)
+    parser.add_argument("--backend", choices=["simpy", "kernel"], default=backend)
+    parser.add_argument("--output", default=None, help="CSV file for the loss-rate series")
+    parser.add_argument("--plot", default=None, help="save the figure to this file instead of showing it")
+    parser.add_argument("--no-plot", action="store_true")
+    parser.add_argument("--checkpoint", default=None, help="snapshot file (.npz) written during the run")
+    parser.add_argument("--checkpoint-every", type=int, default=100, help="snapshot period, in batch-means blocks")
+    parser.add_argument("--resume", action="store_true", help="continue from the snapshot file instead of starting over")
+    parser.add_argument("--spill-dir", default=None,
+                        help="directory for full chunks of the loss-rate series (default: beside --checkpoint, else a temporary directory)")
+    parser.add_argument("--importance-sampling", action="store_true",
+                        help="estimate rare loss rates from regenerative cycles under a change of measure instead of simulating --duration")
+    parser.add_argument("--precision", type=float, default=0.1, help="target epsilon / loss rate of the importance-sampling estimate")
+    parser.add_argument("--max-cycles", type=int, default=10**7)
+    args = parser.parse_args(argv)
+
+    if args.importance_sampling:
+        lossRates, cycles = importanceSamplingLossRate(args.queue_capacity, args.service_rate, args.rates, seed=args.seed,
+                                                       precision=args.precision, maxCycles=args.max_cycles)
+        for ident, (lossRate, halfWidth) in lossRates.items():
+            print(f"Source {ident}: loss rate {lossRate:.6e} +/- {halfWidth:.2e}")
+        print(f"{cycles} cycles under each measure")
+        return
+
+    # The series is spilled to disk as it grows. A checkpointed run keeps its
+    # chunks beside the snapshot, which refers to them, so a resume finds them.
+    with tempfile.TemporaryDirectory(prefix="lossRates") as temporaryDir:
+        spillDir = args.spill_dir or (args.checkpoint + ".spill" if args.checkpoint else temporaryDir)
+        q, sources = simulateLossRate(args.duration, args.queue_capacity, args.service_rate, args.rates, seed=args.seed, backend=args.backend,
+                                      checkpointPath=args.checkpoint, checkpointEvery=args.checkpoint_every, resume=args.resume, spillDir=spillDir)
+        for source in sources:
+            print(f"Source {source.ident}: loss rate {source.queueLosses / source.nbEmmissions}")
+
+        if args.output is not None or not args.no_plot:
+            df_lossRates = q.recorder.to_frame()
+            if args.output is not None:
+                df_lossRates.to_csv(args.output, index=False)
+            if not args.no_plot:
+                plotLossRates(df_lossRates, [source.ident for source in sources], args.plot)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import json
+import os
+
+import numpy as np
+
+class ColumnRecorder(object):
+    # Collects rows into fixed-size NumPy column chunks. Full chunks are kept as
+    # they are (no copying on growth) or, with spill_dir, written to .npy files
+    # so memory stays bounded to a single chunk. Columns declared as "category"
+    # store integer codes and are decoded when the frame is built.
+    def __init__(self, columns, chunk_size=65536, spill_dir=None, prefix="recorder"):
+        self.names = list(columns)
+        self.dtypes = [np.int32 if dtype == "category" else np.dtype(dtype) for dtype in columns.values()]
+        self.categories = [{} if dtype == "category" else None for dtype in columns.values()]
+        self.chunk_size = chunk_size
+        self.spill_dir = spill_dir
+        self.prefix = prefix
+        self.chunks = []
+        self.length = 0
+        self.buffers = self.new_buffers()
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def new_buffers(self):
+        return [np.empty(self.chunk_size, dtype=dtype) for dtype in self.dtypes]
+
+    def __len__(self):
+        return len(self.chunks) * self.chunk_size + self.length
+
+    def append(self, *values):
+        if self.length == self.chunk_size:
+            self.flush()
+
+        index = self.length
+        for buffer, categories, value in zip(self.buffers, self.categories, values):
+            if categories is not None:
+                value = categories.setdefault(value, len(categories))
+            buffer[index] = value
+        self.length += 1
+
+    def flush(self):
+        if self.spill_dir is None:
+            self.chunks.append(self.buffers)
+        else:
+            paths = []
+            for name, buffer in zip(self.names, self.buffers):
+                path = os.path.join(self.spill_dir, f"{self.prefix}_{len(self.chunks):06d}_{name}.npy")
+                np.save(path, buffer)
+                paths.append(path)
+            self.chunks.append(paths)
+        self.buffers = self.new_buffers()
+        self.length = 0
+
+    def load_chunk(self, chunk):
+        if self.spill_dir is None:
+            return chunk
+        return [np.load(path, mmap_mode="r") for path in chunk]
+
+    def raw_columns(self):
+        # Stored values, with categories still as integer codes.
+        parts = [self.load_chunk(chunk) for chunk in self.chunks] + [[buffer[:self.length] for buffer in self.buffers]]
+        return [np.concatenate([part[i] for part in parts]) for i in range(len(self.names))]
+
+    def get_state(self):
+        # Spilled chunks are already on disk, so a snapshot holds their paths
+        # and the rows of the open chunk rather than a copy of every column.
+        state = {"categories": json.dumps([None if categories is None else list(categories) for categories in self.categories])}
+        if self.spill_dir is not None:
+            state["spilled"] = json.dumps(self.chunks)
+            state["columns"] = {name: buffer[:self.length] for name, buffer in zip(self.names, self.buffers)}
+        else:
+            state["columns"] = dict(zip(self.names, self.raw_columns()))
+        return state
+
+    def set_state(self, state):
+        self.categories = [None if labels is None else {label: code for code, label in enumerate(labels)} for labels in json.loads(str(state["categories"]))]
+        self.chunks = json.loads(str(state["spilled"])) if "spilled" in state else []
+        if self.spill_dir is None:
+            # Spilled by the run that saved the snapshot, kept in memory here.
+            self.chunks = [[np.load(path) for path in chunk] for chunk in self.chunks]
+        self.buffers = self.new_buffers()
+        self.length = 0
+        columns = [state["columns"][name] for name in self.names]
+        for start in range(0, len(columns[0]), self.chunk_size):
+            if self.length == self.chunk_size:
+                self.flush()
+            stop = min(start + self.chunk_size, len(columns[0]))
+            for buffer, column in zip(self.buffers, columns):
+                buffer[:stop - start] = column[start:stop]
+            self.length = stop - start
+
+    def columns(self):
+        columns = {}
+        for name, categories, values in zip(self.names, self.categories, self.raw_columns()):
+            if categories is not None:
+                labels = np.empty(len(categories), dtype=object)
+                labels[:] = list(categories)
+                values = labels[values]
+            columns[name] = values
+        return columns
+
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.columns(), columns=self.names)
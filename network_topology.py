@@ -0,0 +1,226 @@
+import argparse
+import heapq
+import time
+from array import array
+
+import numpy as np
+
+from batch_means import BatchMeans
+from packet_ring import PacketRing
+from simulation_project import VariateBuffer
+
+ARRIVAL, DEPARTURE = 0, 1
+
+class HopRing(PacketRing):
+    # PacketRing with one more column: the time the packet left its flow source,
+    # so end-to-end delays survive the hop-by-hop forwarding.
+    def __init__(self, capacity=1024, bounded=False):
+        super().__init__(capacity, bounded)
+        self.origin_time = array("d", bytes(8 * capacity))
+
+    def put(self, enter_time, packet_size, source_id, origin_time=0.0):
+        if self.count == self.capacity:
+            if self.bounded:
+                return False
+            self.grow()
+
+        tail = self.head + self.count
+        if tail >= self.capacity:
+            tail -= self.capacity
+        self.origin_time[tail] = origin_time
+        return super().put(enter_time, packet_size, source_id)
+
+    def get(self):
+        origin_time = self.origin_time[self.head]
+        return super().get() + (origin_time,)
+
+    def grow(self):
+        head = self.head
+        self.origin_time = self.origin_time[head:] + self.origin_time[:head] + array("d", bytes(8 * self.capacity))
+        super().grow()
+
+class Node(object):
+    __slots__ = ("service_rate", "buffer", "busy", "current", "arrivals", "losses", "estimator")
+
+    def __init__(self, service_rate, capacity, block_length):
+        self.service_rate = service_rate
+        self.buffer = HopRing(capacity, bounded=True) if capacity is not None else HopRing()
+        self.busy = False
+        self.current = None
+        self.arrivals = 0
+        self.losses = 0
+        self.estimator = BatchMeans(block_length)
+
+class Flow(object):
+    __slots__ = ("route", "next_hop", "rate", "variates", "sent", "delivered", "lost", "estimator")
+
+    def __init__(self, route, rate, variates, block_length):
+        self.route = route
+        self.next_hop = {node: following for node, following in zip(route, list(route[1:]) + [None])}
+        self.rate = rate
+        self.variates = variates
+        self.sent = 0
+        self.delivered = 0
+        self.lost = 0
+        self.estimator = BatchMeans(block_length)
+
+class Network(object):
+    # Queue nodes driven by a single event heap of (time, seq, kind, index)
+    # entries: one pending arrival per flow and at most one pending departure
+    # per node, so the heap size does not depend on the number of packets.
+    def __init__(self, block_length=50.0, rng=None, buffer_size=65536):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.block_length = block_length
+        self.buffer_size = buffer_size
+        self.nodes = []
+        self.flows = []
+        self.events = []
+        self.sequence = 0
+        self.now = 0.0
+        self.processed_events = 0
+
+    def add_node(self, service_rate, capacity=None):
+        self.nodes.append(Node(service_rate, capacity, self.block_length))
+        return len(self.nodes) - 1
+
+    def add_flow(self, route, rate, packet_sizes, probabilities=None):
+        route = tuple(route)
+        if len(set(route)) != len(route):
+            raise ValueError(f"Route {route} visits a node twice")
+
+        packet_sizes = np.asarray(packet_sizes, dtype=np.int64).reshape(-1)
+        mean_packet_size = float(np.average(packet_sizes, weights=probabilities))
+
+        def draw(count):
+            sizes = self.rng.choice(packet_sizes, size=count, p=probabilities)
+            sending_times = self.rng.exponential(mean_packet_size / rate, size=count)
+            return list(zip(sizes.tolist(), sending_times.tolist()))
+
+        flow_id = len(self.flows)
+        self.flows.append(Flow(route, rate, VariateBuffer(draw, self.buffer_size), self.block_length))
+        self.schedule_arrival(flow_id)
+        return flow_id
+
+    def schedule(self, time, kind, index):
+        self.sequence += 1
+        heapq.heappush(self.events, (time, self.sequence, kind, index))
+
+    def schedule_arrival(self, flow_id):
+        packet_size, sending_time = self.flows[flow_id].variates.next()
+        self.schedule(self.now + sending_time, ARRIVAL, (flow_id, packet_size))
+
+    def run(self, until):
+        events = self.events
+        while events and events[0][0] <= until:
+            event_time, _, kind, index = heapq.heappop(events)
+            self.now = event_time
+            self.processed_events += 1
+            if kind == ARRIVAL:
+                flow_id, packet_size = index
+                flow = self.flows[flow_id]
+                flow.sent += 1
+                self.reception(flow.route[0], event_time, packet_size, flow_id)
+                self.schedule_arrival(flow_id)
+            else:
+                self.departure(index)
+        self.now = until
+
+    def reception(self, node_id, origin_time, packet_size, flow_id):
+        node = self.nodes[node_id]
+        node.arrivals += 1
+        if not node.busy:
+            self.start_service(node_id, node, self.now, packet_size, flow_id, origin_time)
+        elif not node.buffer.put(self.now, packet_size, flow_id, origin_time):
+            node.losses += 1
+            self.flows[flow_id].lost += 1
+
+    def start_service(self, node_id, node, enter_time, packet_size, flow_id, origin_time):
+        node.busy = True
+        node.current = (enter_time, packet_size, flow_id, origin_time)
+        self.schedule(self.now + packet_size / node.service_rate, DEPARTURE, node_id)
+
+    def departure(self, node_id):
+        node = self.nodes[node_id]
+        enter_time, packet_size, flow_id, origin_time = node.current
+        now = self.now
+        node.estimator.add(now, now - enter_time)
+
+        flow = self.flows[flow_id]
+        next_node = flow.next_hop[node_id]
+        if next_node is None:
+            flow.delivered += 1
+            flow.estimator.add(now, now - origin_time)
+        else:
+            self.reception(next_node, origin_time, packet_size, flow_id)
+
+        if len(node.buffer) > 0:
+            self.start_service(node_id, node, *node.buffer.get())
+        else:
+            node.busy = False
+            node.current = None
+
+    def hop_statistics(self):
+        return [(node_id, node.arrivals, node.losses, node.losses / max(node.arrivals, 1),
+                 node.estimator.average(), node.estimator.half_width(self.now)) for node_id, node in enumerate(self.nodes)]
+
+    def flow_statistics(self):
+        return [(flow_id, len(flow.route), flow.sent, flow.delivered, flow.lost, flow.lost / max(flow.sent, 1),
+                 flow.estimator.average(), flow.estimator.half_width(self.now)) for flow_id, flow in enumerate(self.flows)]
+
+def tandem_network(nodes, service_rate, capacity, rate, packet_sizes, probabilities=None, **kwargs):
+    network = Network(**kwargs)
+    route = [network.add_node(service_rate, capacity) for _ in range(nodes)]
+    network.add_flow(route, rate, packet_sizes, probabilities)
+    return network
+
+def mesh_network(layers, width, flows, service_rate, capacity, rate, packet_sizes, probabilities=None, **kwargs):
+    # Layered DAG: every flow crosses the layers left to right through one
+    # randomly chosen router per layer.
+    network = Network(**kwargs)
+    grid = [[network.add_node(service_rate, capacity) for _ in range(width)] for _ in range(layers)]
+    for _ in range(flows):
+        route = [layer[network.rng.integers(width)] for layer in grid]
+        network.add_flow(route, rate, packet_sizes, probabilities)
+    return network
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate tandem or layered-mesh networks of finite-buffer queues.")
+    parser.add_argument("--topology", choices=["tandem", "mesh"], default="mesh")
+    parser.add_argument("--nodes", type=int, default=10, help="routers in the tandem")
+    parser.add_argument("--layers", type=int, default=10)
+    parser.add_argument("--width", type=int, default=20)
+    parser.add_argument("--flows", type=int, default=100)
+    parser.add_argument("--service-rate", type=float, default=100 * 10 ** 6)
+    parser.add_argument("--capacity", type=int, default=50, help="waiting room of every router, in packets")
+    parser.add_argument("--rate", type=float, default=None, help="bit rate of every flow")
+    parser.add_argument("--horizon", type=float, default=1.0)
+    parser.add_argument("--block-length", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    packet_sizes = [400, 4000, 12000]
+    probabilities = [0.4, 0.3, 0.3]
+    options = {"block_length": args.block_length, "rng": np.random.default_rng(args.seed)}
+    if args.topology == "tandem":
+        rate = args.rate if args.rate is not None else 0.8 * args.service_rate
+        network = tandem_network(args.nodes, args.service_rate, args.capacity, rate, packet_sizes, probabilities, **options)
+    else:
+        rate = args.rate if args.rate is not None else 0.8 * args.service_rate * args.width / args.flows
+        network = mesh_network(args.layers, args.width, args.flows, args.service_rate, args.capacity, rate, packet_sizes, probabilities, **options)
+
+    start_time = time.perf_counter()
+    network.run(args.horizon)
+    wall_time = time.perf_counter() - start_time
+
+    hops = network.hop_statistics()
+    flows = network.flow_statistics()
+    print(f"{len(network.nodes)} nodes, {len(network.flows)} flows, {network.processed_events} events in {wall_time:.2f} s ({network.processed_events / wall_time:.0f} events/s)")
+    print(f"{'node':>6}{'arrivals':>12}{'losses':>10}{'loss rate':>12}{'hop response':>15}{'CI':>12}")
+    for node_id, arrivals, losses, loss_rate, average, half_width in hops[:10]:
+        print(f"{node_id:>6}{arrivals:>12}{losses:>10}{loss_rate:>12.2e}{average or 0:>15.6e}{half_width:>12.2e}")
+    print(f"{'flow':>6}{'hops':>6}{'sent':>10}{'delivered':>11}{'lost':>8}{'loss rate':>12}{'end-to-end':>15}{'CI':>12}")
+    for flow_id, hop_count, sent, delivered, lost, loss_rate, average, half_width in flows[:10]:
+        print(f"{flow_id:>6}{hop_count:>6}{sent:>10}{delivered:>11}{lost:>8}{loss_rate:>12.2e}{average or 0:>15.6e}{half_width:>12.2e}")
+
+if __name__ == "__main__":
+    main()
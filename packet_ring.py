@@ -0,0 +1,68 @@
+from array import array
+
+class PacketRing(object):
+    # Single-threaded FIFO of (enter time, packet size, source id) records kept
+    # in preallocated arrays, 16 bytes per record: packet sizes are bit counts
+    # and fit a 32-bit column. A bounded ring refuses packets once full, an
+    # unbounded one doubles its storage instead.
+    def __init__(self, capacity=1024, bounded=False):
+        self.capacity = capacity
+        self.bounded = bounded
+        self.enter_time = array("d", bytes(8 * capacity))
+        self.packet_size = array("i", bytes(4 * capacity))
+        self.source_id = array("i", bytes(4 * capacity))
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def put(self, enter_time, packet_size, source_id):
+        if self.count == self.capacity:
+            if self.bounded:
+                return False
+            self.grow()
+
+        tail = self.head + self.count
+        if tail >= self.capacity:
+            tail -= self.capacity
+        self.enter_time[tail] = enter_time
+        self.packet_size[tail] = packet_size
+        self.source_id[tail] = source_id
+        self.count += 1
+        return True
+
+    def get(self):
+        if self.count == 0:
+            raise IndexError("get from an empty PacketRing")
+        head = self.head
+        self.head = head + 1 if head + 1 < self.capacity else 0
+        self.count -= 1
+        return self.enter_time[head], self.packet_size[head], self.source_id[head]
+
+    def peek(self):
+        # Oldest record, left in the ring.
+        if self.count == 0:
+            raise IndexError("peek into an empty PacketRing")
+        head = self.head
+        return self.enter_time[head], self.packet_size[head], self.source_id[head]
+
+    def snapshot(self):
+        # Queued records in FIFO order.
+        order = [(self.head + i) % self.capacity for i in range(self.count)]
+        return [self.enter_time[i] for i in order], [self.packet_size[i] for i in order], [self.source_id[i] for i in order]
+
+    def restore(self, enter_time, packet_size, source_id):
+        self.head = 0
+        self.count = 0
+        for record in zip(enter_time, packet_size, source_id):
+            if not self.put(*record):
+                raise ValueError(f"{len(enter_time)} packets do not fit in a bounded ring of {self.capacity}")
+
+    def grow(self):
+        head = self.head
+        self.enter_time = self.enter_time[head:] + self.enter_time[:head] + array("d", bytes(8 * self.capacity))
+        self.packet_size = self.packet_size[head:] + self.packet_size[:head] + array("i", bytes(4 * self.capacity))
+        self.source_id = self.source_id[head:] + self.source_id[:head] + array("i", bytes(4 * self.capacity))
+        self.head = 0
+        self.capacity *= 2
@@ -0,0 +1,132 @@
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import simulation_project as sp
+import vectorized_engine
+from checkpoint import Checkpoint
+from result_store import ResultStore, point_key
+
+def run_point(task):
+    engine, burstiness, replication, seed_sequence, variance_reduction, checkpointing, scenario = task
+    if engine == "vectorized":
+        row = vectorized_engine.run_until_confidence(burstiness, np.random.default_rng(seed_sequence), verbose=False, scenario=scenario)
+    else:
+        checkpoint, resume = None, False
+        if checkpointing is not None:
+            directory, every, resume = checkpointing
+            checkpoint = Checkpoint(os.path.join(directory, f"burstiness_{burstiness:g}_replication_{replication}.npz"), every)
+        row = sp.simulate_burstiness(burstiness, seed_sequence, verbose=False, variance_reduction=variance_reduction, backend=engine,
+                                     checkpoint=checkpoint, resume=resume, scenario=scenario)
+
+    return row + [replication]
+
+def point_seed(root, burstiness, replication, common_random_numbers):
+    # Derived from the point itself rather than its position in the grid, so a
+    # given seed reproduces every point regardless of the grid, the workers or
+    # the order they finish in, and growing a grid keeps the cached points.
+    # With common random numbers every burstiness point of a replication
+    # shares that replication's seed.
+    if common_random_numbers:
+        return np.random.SeedSequence(root.entropy, spawn_key=(replication,))
+    return np.random.SeedSequence(root.entropy, spawn_key=(replication, int(round(burstiness * 1000))))
+
+def create_tasks(engine, burstiness_values, replications, seed, variance_reduction, checkpointing=None, scenario=None):
+    root = np.random.SeedSequence(seed)
+    tasks = [(float(burstiness), replication) for burstiness in burstiness_values for replication in range(replications)]
+    return root, [(engine, burstiness, replication, point_seed(root, burstiness, replication, variance_reduction.common_random_numbers),
+                   variance_reduction, checkpointing, scenario) for burstiness, replication in tasks]
+
+def describe_task(task):
+    # Everything that determines the result of a point; checkpointing does not.
+    engine, burstiness, replication, seed_sequence, variance_reduction, _, scenario = task
+    description = {"engine": engine, "model_version": sp.model_version, "burstiness": burstiness, "replication": replication,
+                   "seed": {"entropy": str(seed_sequence.entropy), "spawn_key": list(seed_sequence.spawn_key)},
+                   "variance_reduction": [variance_reduction.common_random_numbers, variance_reduction.antithetic, variance_reduction.control_variates],
+                   "scenario": scenario.to_dict()}
+    if scenario.trace is not None:
+        # The scenario names the trace by path only; a file rewritten in place
+        # changes size or modification time.
+        trace_file = os.stat(scenario.trace)
+        description["trace_file"] = {"size": trace_file.st_size, "mtime_ns": trace_file.st_mtime_ns}
+    return description
+
+def run_sweep(burstiness_values, replications=1, seed=None, workers=None, engine="simpy", output="data.csv", variance_reduction=None, checkpointing=None, scenario=None,
+              store=None):
+    # checkpointing is (directory, blocks between snapshots, resume) or None.
+    # With a ResultStore, points it holds are copied instead of computed, new
+    # ones are appended to it, and the sweep is also exported in columns next
+    # to the CSV output (.npz).
+    if variance_reduction is None:
+        variance_reduction = sp.VarianceReduction()
+    if scenario is None:
+        scenario = sp.Scenario()
+    if checkpointing is not None:
+        os.makedirs(checkpointing[0], exist_ok=True)
+    root, tasks = create_tasks(engine, burstiness_values, replications, seed, variance_reduction, checkpointing, scenario)
+    print(f"Seed entropy: {root.entropy}")
+    keys = {id(task): point_key(describe_task(task)) for task in tasks} if store is not None else {}
+    # Rows by position in tasks, cached or computed, written in that order as
+    # soon as every earlier one is in.
+    rows = {i: store.get(keys[id(task)]) for i, task in enumerate(tasks) if store is not None and keys[id(task)] in store}
+    pending = [(i, task) for i, task in enumerate(tasks) if i not in rows]
+
+    with open(output, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(sp.headers + ["replication"])
+        written = 0
+
+        def write_ready():
+            nonlocal written
+            while written in rows:
+                writer.writerow(rows[written])
+                written += 1
+            file.flush()
+
+        if store is not None:
+            print(f"{len(rows)} of {len(tasks)} points found in {store.directory}")
+        write_ready()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for (i, task), row in zip(pending, executor.map(run_point, [task for _, task in pending])):
+                rows[i] = row
+                write_ready()
+                if store is not None:
+                    store.append(keys[id(task)], describe_task(task), row)
+                print(f"Burstiness {row[0]} replication {row[-1]} done at time {row[1]:.2f}")
+
+    if store is not None:
+        store.export(os.path.splitext(output)[0] + ".npz", sp.headers + ["replication"], [keys[id(task)] for task in tasks])
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the burstiness sweep across a process pool.")
+    parser.add_argument("--burstiness", type=float, nargs="+", default=list(np.arange(20.0, 101, 10)))
+    parser.add_argument("--replications", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--engine", choices=["simpy", "kernel", "vectorized"], default="simpy",
+                        help="simpy or the lean event kernel run the process-based model, vectorized the NumPy FIFO engine")
+    parser.add_argument("--output", default="data.csv")
+    parser.add_argument("--common-random-numbers", action="store_true", help="reuse each replication's random streams across burstiness points")
+    parser.add_argument("--antithetic", action="store_true", help="run every point alongside an antithetic twin (process-based engines)")
+    parser.add_argument("--control-variates", action="store_true", help="correct estimates with the known offered load (process-based engines)")
+    parser.add_argument("--checkpoint-dir", default=None, help="write one snapshot per point to this directory (process-based engines)")
+    parser.add_argument("--checkpoint-every", type=int, default=20, help="blocks between snapshots")
+    parser.add_argument("--resume", action="store_true", help="continue every point from its snapshot in --checkpoint-dir")
+    parser.add_argument("--store", default=None, help="result store directory: cached points are reused and new ones added (needs --seed to hit)")
+    args = parser.parse_args()
+
+    if args.engine == "vectorized" and (args.antithetic or args.control_variates or args.checkpoint_dir):
+        parser.error("--antithetic, --control-variates and --checkpoint-dir need the simpy or kernel engine")
+    if args.resume and not args.checkpoint_dir:
+        parser.error("--resume needs --checkpoint-dir")
+
+    variance_reduction = sp.VarianceReduction(args.common_random_numbers, args.antithetic, args.control_variates)
+    checkpointing = (args.checkpoint_dir, args.checkpoint_every, args.resume) if args.checkpoint_dir else None
+    store = ResultStore(args.store) if args.store else None
+    run_sweep(args.burstiness, args.replications, args.seed, args.workers, args.engine, args.output, variance_reduction, checkpointing, store=store)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import argparse
+import cProfile
+import collections
+import os
+import pstats
+import signal
+import time
+
+import numpy as np
+
+from event_kernel import create_environment
+from simulation_project import DataSource, create_model
+
+# Instrumentation replaces methods on the model instances, never on the
+# classes, so a model that is not instrumented runs the unmodified code and
+# the disabled profiler costs nothing. Every call is counted. Per-packet
+# stages time one call in sample_every and extrapolate from those; rare and
+# expensive ones (variate draws, stopping checks) time every call, since a
+# single sampled call would stand for the whole stage.
+
+class Stage(object):
+    __slots__ = ("name", "calls", "timed_calls", "timed_seconds")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.timed_calls = 0
+        self.timed_seconds = 0.0
+
+    def seconds(self):
+        if self.timed_calls == 0:
+            return 0.0
+        return self.timed_seconds * self.calls / self.timed_calls
+
+class Profiler(object):
+    def __init__(self, sample_every=16):
+        self.sample_every = sample_every
+        self.stages = {}
+        self.wall_seconds = 0.0
+
+    def wrap(self, name, function, sample_every=None):
+        stage = self.stages.setdefault(name, Stage(name))
+        sample_every = sample_every or self.sample_every
+        clock = time.perf_counter
+
+        def timed(*args):
+            stage.calls += 1
+            if (stage.calls - 1) % sample_every:
+                return function(*args)
+            start_time = clock()
+            value = function(*args)
+            stage.timed_seconds += clock() - start_time
+            stage.timed_calls += 1
+            return value
+        return timed
+
+    def attach(self, owner, attribute, name, sample_every=None):
+        setattr(owner, attribute, self.wrap(name, getattr(owner, attribute), sample_every))
+
+    def instrument(self, env, sources, result):
+        # The stages do not nest, so whatever they leave of the wall time is
+        # the event loop itself: scheduling, process switches and timeouts.
+        queue = next(iter(sources.values())).queue
+        self.attach(queue, "reception", "enqueue")
+        self.attach(queue.buffer, "get", "dequeue")
+        for source in sources.values():
+            if isinstance(source, DataSource):
+                # Buffered sizes and gaps come from draw, called by refill;
+                # without a buffer every size is drawn on its own.
+                self.attach(source, "draw", "data variate draw", 1)
+                if not source.buffer_size:
+                    self.attach(source, "get_packet_size", "packet size draw")
+            else:
+                self.attach(source, "refill", "variate refill", 1)
+            self.attach(source, "acknowledge", "statistics")
+
+    def instrument_checks(self, sources, result):
+        # Given the objects the stopping check reads, which are the antithetic
+        # pairs rather than the models when twins are simulated.
+        for source in sources.values():
+            self.attach(source, "calculate_confidence_interval", "stopping check", 1)
+        self.attach(result, "calculate_confidence_interval", "stopping check", 1)
+
+    def run(self, env, until):
+        start_time = time.perf_counter()
+        value = env.run(until=until)
+        self.wall_seconds += time.perf_counter() - start_time
+        return value
+
+    def breakdown(self):
+        rows = [(stage.name, stage.calls, stage.seconds()) for stage in self.stages.values()]
+        rows.append(("event loop", None, max(self.wall_seconds - sum(seconds for _, _, seconds in rows), 0.0)))
+        return rows
+
+    def report(self):
+        print(f"{'stage':<18}{'calls':>12}{'seconds':>10}{'share':>8}{'ns/call':>10}")
+        for name, calls, seconds in self.breakdown():
+            share = seconds / self.wall_seconds if self.wall_seconds > 0 else 0.0
+            per_call = f"{seconds / calls * 1e9:>10.0f}" if calls else f"{'':>10}"
+            print(f"{name:<18}{calls if calls is not None else '':>12}{seconds:>10.3f}{share:>8.1%}{per_call}")
+        print(f"{'total':<18}{'':>12}{self.wall_seconds:>10.3f}   (per-packet stages: 1 call in {self.sample_every} timed)")
+
+class StackSampler(object):
+    # Samples the Python stack on a CPU-time timer and counts it in the
+    # collapsed "outer;...;inner count" format read by flamegraph tools.
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = collections.Counter()
+
+    def sample(self, signum, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        self.stacks[";".join(reversed(names))] += 1
+
+    def runcall(self, function, *args):
+        if not hasattr(signal, "setitimer"):
+            raise RuntimeError("Stack sampling needs signal.setitimer, which this platform does not have")
+        previous = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        try:
+            return function(*args)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, previous)
+
+    def write_collapsed(self, path):
+        with open(path, "w") as file:
+            for stack, count in sorted(self.stacks.items()):
+                file.write(f"{stack} {count}\n")
+
+def export_pstats(path, function, *args, sort="cumulative", limit=25):
+    profile = cProfile.Profile()
+    value = profile.runcall(function, *args)
+    profile.dump_stats(path)
+    pstats.Stats(profile).sort_stats(sort).print_stats(limit)
+    return value
+
+def run_model(burstiness, duration, backend="simpy", seed=1, profiler=None):
+    env = create_environment(backend)
+    sources, result = create_model(env, burstiness, np.random.SeedSequence(seed))
+    if profiler is not None:
+        profiler.instrument(env, sources, result)
+        profiler.run(env, duration)
+    else:
+        env.run(until=duration)
+    return sources, result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage cost breakdown of the Data/Voice/Video model, with cProfile and collapsed-stack exports.")
+    parser.add_argument("--burstiness", type=float, default=40.0)
+    parser.add_argument("--duration", type=float, default=5.0, help="simulated time of each profiled run")
+    parser.add_argument("--backend", choices=["simpy", "kernel"], default="simpy")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--sample-every", type=int, default=16, help="time one call in this many")
+    parser.add_argument("--pstats", default=None, help="also run under cProfile and dump the stats to this file")
+    parser.add_argument("--collapsed", default=None, help="also sample stacks and write them in collapsed format to this file")
+    parser.add_argument("--interval", type=float, default=0.001, help="CPU seconds between stack samples")
+    args = parser.parse_args(argv)
+
+    profiler = Profiler(args.sample_every)
+    run_model(args.burstiness, args.duration, args.backend, args.seed, profiler)
+    profiler.report()
+
+    # Each export profiles its own uninstrumented run of the same model.
+    if args.pstats:
+        export_pstats(args.pstats, run_model, args.burstiness, args.duration, args.backend, args.seed)
+    if args.collapsed:
+        sampler = StackSampler(args.interval)
+        sampler.runcall(run_model, args.burstiness, args.duration, args.backend, args.seed)
+        sampler.write_collapsed(args.collapsed)
+        print(f"{sum(sampler.stacks.values())} stack samples written to {args.collapsed}")
+
+if __name__ == "__main__":
+    main()
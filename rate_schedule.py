@@ -0,0 +1,64 @@
+import bisect
+import math
+
+# Piecewise-constant load profiles. A schedule multiplies the nominal rate of
+# a source by factors[i] from times[i] until times[i + 1]; with a period it
+# repeats, otherwise the last factor holds to the end of the run. Factors are
+# positive so that every source keeps a finite gap between packets.
+
+class RateSchedule(object):
+    def __init__(self, times, factors, period=None):
+        times = [float(time) for time in times]
+        factors = [float(factor) for factor in factors]
+        if not times or len(times) != len(factors):
+            raise ValueError("A rate schedule needs one factor per change time")
+        if times[0] != 0 or any(later <= earlier for earlier, later in zip(times, times[1:])):
+            raise ValueError("Rate schedule times must start at 0 and increase")
+        if min(factors) <= 0:
+            raise ValueError("Rate schedule factors must be positive")
+        if period is not None and period <= times[-1]:
+            raise ValueError("The period of a rate schedule must end after its last change")
+        self.times = times
+        self.factors = factors
+        self.period = period
+        self.peak = max(factors)
+
+    def factor(self, now):
+        if self.period is not None:
+            now = math.fmod(now, self.period)
+        return self.factors[bisect.bisect_right(self.times, now) - 1]
+
+    def to_dict(self):
+        return {"times": self.times, "factors": self.factors, "period": self.period}
+
+def ramp(start_factor, end_factor, duration, steps=10):
+    # steps equal intervals over duration, the first at start_factor and the
+    # last at end_factor, which then holds.
+    if steps < 2:
+        raise ValueError("A ramp needs at least 2 steps")
+    times = [duration * i / steps for i in range(steps)]
+    factors = [start_factor + (end_factor - start_factor) * i / (steps - 1) for i in range(steps)]
+    return RateSchedule(times, factors)
+
+def diurnal(low, high, period, steps=24):
+    # A sinusoidal day, lowest at time 0 and highest half a period later,
+    # taken at the middle of each of the steps.
+    times = [period * i / steps for i in range(steps)]
+    factors = [low + (high - low) * (1 - math.cos(2 * math.pi * (i + 0.5) / steps)) / 2 for i in range(steps)]
+    return RateSchedule(times, factors, period)
+
+profiles = {"ramp": ramp, "diurnal": diurnal}
+
+def create_schedule(description):
+    # From the scenario parameter rate_schedule: either explicit times,
+    # factors and optional period, or {"profile": "ramp" | "diurnal", ...}
+    # with the arguments of that profile.
+    if description is None or isinstance(description, RateSchedule):
+        return description
+    description = dict(description)
+    profile = description.pop("profile", None)
+    if profile is None:
+        return RateSchedule(description["times"], description["factors"], description.get("period"))
+    if profile not in profiles:
+        raise ValueError(f"Unknown load profile: {profile} (expected one of {', '.join(profiles)})")
+    return profiles[profile](**description)
@@ -0,0 +1,163 @@
+import argparse
+import math
+import sys
+
+import numpy as np
+
+import simulation_project as sp
+
+def mm1n_loss(arrival_rate, service_rate, capacity):
+    # Blocking probability of an M/M/1/N queue, N counting the packet in service.
+    rho = np.asarray(arrival_rate, dtype=float) / np.asarray(service_rate, dtype=float)
+    capacity = np.asarray(capacity, dtype=float)
+    balanced = np.isclose(rho, 1.0)
+    safe_rho = np.where(balanced, 0.5, rho)
+    loss = (1 - safe_rho) * safe_rho ** capacity / (1 - safe_rho ** (capacity + 1))
+    return np.where(balanced, 1 / (capacity + 1), loss)
+
+def packet_mix_moments(packet_sizes, probabilities, service_rate):
+    service_times = np.asarray(packet_sizes, dtype=float) / service_rate
+    probabilities = np.asarray(probabilities, dtype=float)
+    return float(np.dot(probabilities, service_times)), float(np.dot(probabilities, service_times ** 2))
+
+def mg1_response_time(arrival_rates, mean_service, second_moment_service):
+    # Pollaczek-Khinchine: every class of a FIFO M/G/1 queue waits
+    # W = sum(lambda_i E[S_i^2]) / (2 (1 - rho)) and responds in W + E[S_i].
+    # Classes are on the last axis, any leading axes form a parameter grid.
+    arrival_rates = np.asarray(arrival_rates, dtype=float)
+    mean_service = np.asarray(mean_service, dtype=float)
+    second_moment_service = np.asarray(second_moment_service, dtype=float)
+    rho = np.sum(arrival_rates * mean_service, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        waiting_time = np.where(rho < 1, np.sum(arrival_rates * second_moment_service, axis=-1) / (2 * (1 - rho)), np.inf)
+    response_times = waiting_time[..., np.newaxis] + mean_service
+    total = np.sum(arrival_rates * response_times, axis=-1) / np.sum(arrival_rates, axis=-1)
+    return response_times, total
+
+def simulation_project_classes(service_rate=sp.service_rate):
+    # Packet rates and service-time moments of the Data/Voice/Video mix.
+    data_mean, data_second = packet_mix_moments(sp.data_packet_sizes, sp.data_packet_size_probabilities, service_rate)
+    data_packet_rate = sp.data_rate / float(np.dot(sp.data_packet_sizes, sp.data_packet_size_probabilities))
+    voice_service = sp.voice_packet_size / service_rate
+    video_service = sp.video_packet_size / service_rate
+    arrival_rates = np.array([data_packet_rate, sp.voice_rate / sp.voice_packet_size, sp.video_rate / sp.video_packet_size])
+    mean_service = np.array([data_mean, voice_service, video_service])
+    second_moment_service = np.array([data_second, voice_service ** 2, video_service ** 2])
+    return arrival_rates, mean_service, second_moment_service
+
+def batch_means_half_width(block_means):
+    block_means = np.asarray(block_means, dtype=float)
+    if len(block_means) <= 1:
+        return math.inf
+    return 4.5 * float(np.std(block_means, ddof=1)) / math.sqrt(len(block_means))
+
+def check_against_theory(estimate, half_width, theory):
+    return abs(estimate - theory) <= half_width
+
+def mm1n_case(horizon, blocks, seed):
+    import simpy
+
+    import exerciseMM1NForComparison as mm1n
+
+    np.random.seed(seed)
+    env = simpy.Environment()
+    q = mm1n.queueClass(env, 10, 1.0)
+    source = mm1n.poissonSource(env, 0.9, q)
+    block_means = []
+    emissions, losses = 0, 0
+    for block in range(1, blocks + 1):
+        env.run(until=horizon * block / blocks)
+        block_means.append((source.queueLosses - losses) / max(source.nbEmissions - emissions, 1))
+        emissions, losses = source.nbEmissions, source.queueLosses
+    estimate = source.queueLosses / source.nbEmissions
+    return [("M/M/1/10 loss, rho=0.9", estimate, batch_means_half_width(block_means), float(mm1n_loss(0.9, 1.0, 10)))]
+
+def loss_rate_case(horizon, blocks, seed):
+    import simpy
+
+    import loss_rate_estimation as lre
+
+    np.random.seed(seed)
+    env = simpy.Environment()
+    q = lre.queueClass(env, 10, 1.0)
+    sources = [lre.poissonSource(env, 0.1, q, 1, 1), lre.poissonSource(env, 0.7, q, 2, 1)]
+    block_means = {source.ident: [] for source in sources}
+    previous = {source.ident: (0, 0) for source in sources}
+    for block in range(1, blocks + 1):
+        env.run(until=horizon * block / blocks)
+        for source in sources:
+            emissions, losses = previous[source.ident]
+            block_means[source.ident].append((source.queueLosses - losses) / max(source.nbEmmissions - emissions, 1))
+            previous[source.ident] = (source.nbEmmissions, source.queueLosses)
+
+    # The waiting room holds queueCapa packets on top of the one in service,
+    # and by PASTA both Poisson sources see the same blocking probability.
+    theory = float(mm1n_loss(0.8, 1.0, 11))
+    return [(f"two-source loss, source {source.ident}", source.queueLosses / source.nbEmmissions,
+             batch_means_half_width(block_means[source.ident]), theory) for source in sources]
+
+def importance_sampling_case(queue_capacity, seed):
+    import loss_rate_estimation as lre
+
+    loss_rates, _ = lre.importanceSamplingLossRate(queue_capacity, seed=seed)
+    theory = float(mm1n_loss(0.8, 1.0, queue_capacity + 1))
+    return [(f"rare loss (IS), N={queue_capacity + 1}, source {ident}", loss_rate, half_width, theory)
+            for ident, (loss_rate, half_width) in loss_rates.items()]
+
+def mg1_case(horizon, blocks, seed):
+    from batch_means import BatchMeans
+    from vectorized_engine import fifo_departures
+
+    rng = np.random.default_rng(seed)
+    arrival_rates, mean_service, second_moment_service = simulation_project_classes()
+    times, service_times, class_ids = [], [], []
+    for class_id, rate in enumerate(arrival_rates):
+        count = rng.poisson(rate * horizon)
+        times.append(np.sort(rng.uniform(0, horizon, count)))
+        if class_id == 0:
+            service_times.append(rng.choice(sp.data_packet_sizes, count, p=sp.data_packet_size_probabilities) / sp.service_rate)
+        else:
+            service_times.append(np.full(count, mean_service[class_id]))
+        class_ids.append(np.full(count, class_id))
+
+    order = np.argsort(np.concatenate(times), kind="stable")
+    arrivals = np.concatenate(times)[order]
+    departures = fifo_departures(arrivals, np.concatenate(service_times)[order])
+    class_ids = np.concatenate(class_ids)[order]
+    done = departures <= horizon
+
+    theory, theory_total = mg1_response_time(arrival_rates, mean_service, second_moment_service)
+    rows = []
+    for class_id, name in enumerate(["Data", "Voice", "Video", "Total"]):
+        mask = done if class_id == 3 else done & (class_ids == class_id)
+        estimator = BatchMeans(horizon / blocks)
+        estimator.add_many(departures[mask], departures[mask] - arrivals[mask])
+        expected = theory_total if class_id == 3 else theory[class_id]
+        rows.append((f"M/G/1 Poisson mix, {name}", estimator.average(), estimator.half_width(horizon), float(expected)))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Check simulation engines against closed-form M/M/1/N and M/G/1 results.")
+    parser.add_argument("--horizon", type=float, default=200000.0, help="simulated time of the M/M/1/N runs")
+    parser.add_argument("--mg1-horizon", type=float, default=200.0, help="simulated time of the M/G/1 run")
+    parser.add_argument("--blocks", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=10)
+    parser.add_argument("--rare-capacity", type=int, default=60, help="waiting room of the importance-sampling loss case")
+    args = parser.parse_args()
+
+    rows = (mm1n_case(args.horizon, args.blocks, args.seed)
+            + loss_rate_case(args.horizon, args.blocks, args.seed)
+            + importance_sampling_case(args.rare_capacity, args.seed)
+            + mg1_case(args.mg1_horizon, args.blocks, args.seed))
+
+    failures = 0
+    print(f"{'case':<32}{'estimate':>14}{'half width':>14}{'theory':>14}  status")
+    for name, estimate, half_width, theory in rows:
+        passed = check_against_theory(estimate, half_width, theory)
+        failures += not passed
+        print(f"{name:<32}{estimate:>14.6e}{half_width:>14.2e}{theory:>14.6e}  {'ok' if passed else 'FAIL'}")
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
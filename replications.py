@@ -0,0 +1,234 @@
+import argparse
+import math
+import multiprocessing
+import time
+import traceback
+
+import numpy as np
+
+import loss_rate_estimation as lre
+import simulation_project as sp
+from event_kernel import create_environment
+from parallel_sweep import point_seed
+from simulate import parse_assignment
+
+# Independent replications of one scenario, run by worker processes that
+# claim replication numbers from a shared counter and stream the count, sum
+# and sum of squares of every finished replication's estimates back. The
+# coordinator merges them in replication order, so the stopping decision and
+# the estimate do not depend on the number of workers or on which finishes
+# first, and tells every worker to drop its replication once all relative
+# half-widths are below the threshold.
+
+# 97.5% quantiles of Student's t for 1 to 30 degrees of freedom.
+t_quantiles = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131,
+               2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+def t_quantile(degrees):
+    if degrees <= len(t_quantiles):
+        return t_quantiles[degrees - 1]
+    return 1.96 + 2.5 / degrees   # within 0.002 of the quantile past 30
+
+class ReplicationStatistics(object):
+    def __init__(self, names):
+        self.names = names
+        self.count = 0
+        self.sums = np.zeros(len(names))
+        self.squares = np.zeros(len(names))
+
+    def merge(self, count, sums, squares):
+        self.count += count
+        self.sums += sums
+        self.squares += squares
+
+    def means(self):
+        return self.sums / self.count
+
+    def half_widths(self):
+        if self.count <= 1:
+            return np.full(len(self.names), math.inf)
+        variance = np.maximum(self.squares - self.sums ** 2 / self.count, 0.0) / (self.count - 1)
+        return t_quantile(self.count - 1) * np.sqrt(variance / self.count)
+
+    def relative_half_widths(self):
+        means = self.means() if self.count else np.zeros(len(self.names))
+        relative = np.full(len(self.names), math.inf)
+        np.divide(self.half_widths(), means, out=relative, where=means > 0)
+        return relative
+
+def advance(env, until, step, stop):
+    # Runs to until in steps, giving up as soon as the coordinator says stop.
+    while env.now < until:
+        if stop.is_set():
+            return False
+        env.run(until=min(env.now + step, until))
+    return True
+
+class ProjectReplication(object):
+    # Mean response time of each source and of all packets served between the
+    # end of the warm-up and warmup + duration.
+    names = ["data", "voice", "video", "total"]
+
+    def __init__(self, burstiness, duration, warmup, scenario=None, backend="simpy"):
+        self.burstiness = burstiness
+        self.duration = duration
+        self.warmup = warmup
+        self.scenario = scenario if scenario is not None else sp.Scenario()
+        self.backend = backend
+
+    def seed(self, root, index):
+        # The seed of the same replication in a sweep of this burstiness.
+        return point_seed(root, self.burstiness, index, False)
+
+    def run(self, seed_sequence, stop):
+        env = create_environment(self.backend)
+        sources, result = sp.create_model(env, self.burstiness, seed_sequence, scenario=self.scenario)
+        estimators = list(sources.values()) + [result]
+        step = self.scenario.block_size
+        if not advance(env, self.warmup, step, stop):
+            return None
+        start = [(estimator.get_total_processed_packet(), estimator.get_total_response_time()) for estimator in estimators]
+        if not advance(env, self.warmup + self.duration, step, stop):
+            return None
+        return np.array([(estimator.get_total_response_time() - total) / max(estimator.get_total_processed_packet() - count, 1)
+                         for estimator, (count, total) in zip(estimators, start)])
+
+class LossRateReplication(object):
+    # Loss rate of each source of the loss_rate_estimation model and of all
+    # of them, counted after the warm-up.
+    def __init__(self, duration, warmup, queue_capacity=10, service_rate=1.0, rates=(0.1, 0.7), packet_size=1, backend="simpy"):
+        self.duration = duration
+        self.warmup = warmup
+        self.queue_capacity = queue_capacity
+        self.service_rate = service_rate
+        self.rates = list(rates)
+        self.packet_size = packet_size
+        self.backend = backend
+        self.names = [f"source {ident}" for ident in range(1, len(self.rates) + 1)] + ["total"]
+
+    def seed(self, root, index):
+        return np.random.SeedSequence(root.entropy, spawn_key=(index,))
+
+    def counters(self, sources):
+        emissions = [source.nbEmmissions for source in sources]
+        losses = [source.queueLosses for source in sources]
+        return np.array(emissions + [sum(emissions)], dtype=float), np.array(losses + [sum(losses)], dtype=float)
+
+    def run(self, seed_sequence, stop):
+        # The model draws from the legacy global generator, seeded per
+        # replication; each worker runs one replication at a time.
+        np.random.seed(int(seed_sequence.generate_state(1)[0]))
+        env = create_environment(self.backend)
+        q = lre.queueClass(env, self.queue_capacity, self.service_rate, blockLength=math.sqrt(self.duration))
+        sources = [lre.poissonSource(env, rate, q, ident, self.packet_size) for ident, rate in enumerate(self.rates, start=1)]
+        step = self.duration / 100
+        if not advance(env, self.warmup, step, stop):
+            return None
+        start_emissions, start_losses = self.counters(sources)
+        if not advance(env, self.warmup + self.duration, step, stop):
+            return None
+        emissions, losses = self.counters(sources)
+        return (losses - start_losses) / np.maximum(emissions - start_emissions, 1)
+
+def worker(replication, root, claim, max_replications, results, stop):
+    try:
+        while not stop.is_set():
+            with claim.get_lock():
+                index = claim.value
+                if index >= max_replications:
+                    break
+                claim.value += 1
+            values = replication.run(replication.seed(root, index), stop)
+            if values is None:
+                break
+            results.put(("replication", index, 1, values, values ** 2))
+    except Exception:
+        results.put(("error", traceback.format_exc()))
+    results.put(("done",))
+
+def run_replications(replication, threshold, workers=None, seed=None, min_replications=10, max_replications=10000, verbose=True):
+    # Returns the merged statistics, the wall time until they met the
+    # threshold (None if max_replications came first) and the total wall time.
+    workers = workers or multiprocessing.cpu_count()
+    root = np.random.SeedSequence(seed)
+    claim = multiprocessing.Value("q", 0)
+    results = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    statistics = ReplicationStatistics(replication.names)
+    finished = {}
+    errors = []
+    time_to_precision = None
+
+    start_time = time.perf_counter()
+    processes = [multiprocessing.Process(target=worker, args=(replication, root, claim, max_replications, results, stop)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    running = workers
+    while running:
+        message = results.get()
+        if message[0] == "done":
+            running -= 1
+        elif message[0] == "error":
+            errors.append(message[1])
+            stop.set()
+        elif not stop.is_set():
+            finished[message[1]] = message[2:]
+            while statistics.count in finished:
+                statistics.merge(*finished.pop(statistics.count))
+                relative = statistics.relative_half_widths()
+                if verbose:
+                    print(f"Replication {statistics.count}: " + ", ".join(f"{name} {value:.4f}" for name, value in zip(statistics.names, relative)))
+                if statistics.count >= min_replications and np.all(relative < threshold):
+                    time_to_precision = time.perf_counter() - start_time
+                    stop.set()
+                    break
+    for process in processes:
+        process.join()
+    if errors:
+        raise RuntimeError(f"A replication failed:\n{errors[0]}")
+    return statistics, time_to_precision, time.perf_counter() - start_time
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate with independent replications run in parallel, until every relative half-width is below the threshold.")
+    subparsers = parser.add_subparsers(dest="model", required=True)
+    project_parser = subparsers.add_parser("project", help="one burstiness point of the Data/Voice/Video model")
+    project_parser.add_argument("--burstiness", type=float, default=40.0)
+    project_parser.add_argument("--duration", type=float, default=100.0, help="simulated time measured by each replication")
+    project_parser.add_argument("--warmup", type=float, default=10.0, help="simulated time discarded at the start of each replication")
+    project_parser.add_argument("--threshold", type=float, default=None, help="relative half-width to reach (default: confidence_threshold)")
+    project_parser.add_argument("--set", type=parse_assignment, action="append", default=[], metavar="NAME=VALUE", help="override a model parameter")
+    loss_parser = subparsers.add_parser("loss-rate", help="the multi-source M/M/1/N loss-rate model")
+    loss_parser.add_argument("--duration", type=float, default=100000.0)
+    loss_parser.add_argument("--warmup", type=float, default=1000.0)
+    loss_parser.add_argument("--threshold", type=float, default=0.1)
+    loss_parser.add_argument("--queue-capacity", type=int, default=10)
+    loss_parser.add_argument("--service-rate", type=float, default=1.0)
+    loss_parser.add_argument("--rates", type=float, nargs="+", default=[0.1, 0.7])
+    for subparser in (project_parser, loss_parser):
+        subparser.add_argument("--workers", type=int, default=None)
+        subparser.add_argument("--seed", type=int, default=None)
+        subparser.add_argument("--backend", choices=["simpy", "kernel"], default="simpy")
+        subparser.add_argument("--min-replications", type=int, default=10)
+        subparser.add_argument("--max-replications", type=int, default=10000)
+        subparser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.model == "project":
+        scenario = sp.Scenario(**dict(args.set))
+        replication = ProjectReplication(args.burstiness, args.duration, args.warmup, scenario, args.backend)
+        threshold = args.threshold if args.threshold is not None else scenario.confidence_threshold
+    else:
+        replication = LossRateReplication(args.duration, args.warmup, args.queue_capacity, args.service_rate, args.rates, backend=args.backend)
+        threshold = args.threshold
+
+    statistics, time_to_precision, wall_time = run_replications(replication, threshold, args.workers, args.seed, args.min_replications,
+                                                                args.max_replications, not args.quiet)
+    for name, mean, half_width in zip(statistics.names, statistics.means(), statistics.half_widths()):
+        print(f"{name}: {mean:.6g} +/- {half_width:.3g} ({half_width / mean if mean > 0 else math.inf:.2%})")
+    if time_to_precision is not None:
+        print(f"{statistics.count} replications reached {threshold:.0%} in {time_to_precision:.2f} s wall time")
+    else:
+        print(f"Stopped after {statistics.count} replications without reaching {threshold:.0%} ({wall_time:.2f} s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Sweep results, one JSON line per point in an append-only file, keyed by a
+# hash of everything that determines the point: model and stopping
+# parameters, burstiness, replication, seed, variance reduction, engine and
+# model version. A point already in the store is not computed again.
+
+def canonical(value):
+    # Integral and float parameters hash alike, so 1000 and 1000.0 from
+    # different scenario files give the same key.
+    if isinstance(value, dict):
+        return {str(key): canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [canonical(item) for item in value]
+    if isinstance(value, (bool, np.bool_, str)) or value is None:
+        return bool(value) if isinstance(value, np.bool_) else value
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    return str(value)
+
+def point_key(description):
+    text = json.dumps(canonical(description), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class ResultStore(object):
+    def __init__(self, directory="results"):
+        self.directory = directory
+        self.path = os.path.join(directory, "points.jsonl")
+        self.rows = {}
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue   # last line cut short by a crash
+                    self.rows[record["key"]] = record["row"]
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, key):
+        return self.rows[key]
+
+    def append(self, key, description, row):
+        # One write of one line in append mode, synced before returning, so a
+        # crash loses at most the line being written.
+        row = [value.item() if isinstance(value, np.generic) else value for value in row]
+        line = json.dumps({"key": key, "point": canonical(description), "row": row}) + "\n"
+        with open(self.path, "a") as file:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+        self.rows[key] = row
+
+    def export(self, path, headers, keys=None):
+        # Columnar copy of the rows (all, or those of keys in that order),
+        # written beside the target and renamed over it.
+        keys = list(self.rows) if keys is None else keys
+        table = np.array([self.rows[key] for key in keys], dtype=float).reshape(len(keys), len(headers))
+        columns = {name: table[:, i] for i, name in enumerate(headers)}
+        columns["key"] = np.array(keys, dtype=str)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            np.savez(file, **columns)
+        os.replace(temporary, path)
+
+def load_columns(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
@@ -0,0 +1,180 @@
+import heapq
+from collections import deque
+
+from packet_ring import PacketRing
+
+# Multi-class buffers with the put/get/len interface of PacketRing, so a
+# QueueClass serves them as it serves its FIFO ring. Classes are the source
+# ids handed out by QueueClass.register and every setting is a list indexed
+# by them. Each class keeps its own ring; the scheduler only picks which
+# ring the next packet comes from.
+
+schedulers = ["fifo", "priority", "wfq", "drr"]
+
+class MultiClassBuffer(object):
+    def __init__(self, classes):
+        self.rings = [PacketRing() for _ in range(classes)]
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def put(self, enter_time, packet_size, source_id):
+        self.rings[source_id].put(enter_time, packet_size, source_id)
+        self.count += 1
+        self.enqueued(source_id, packet_size)
+        return True
+
+    def get(self):
+        source_id = self.select()
+        self.count -= 1
+        return self.rings[source_id].get()
+
+    def enqueued(self, source_id, packet_size):
+        pass
+
+    def select(self):
+        pass
+
+    def get_state(self):
+        rings = {}
+        for source_id, ring in enumerate(self.rings):
+            enter_time, packet_size, ids = ring.snapshot()
+            rings[str(source_id)] = {"enter_time": enter_time, "packet_size": packet_size, "source_id": ids}
+        return {"rings": rings}
+
+    def set_state(self, state):
+        for source_id, ring in enumerate(self.rings):
+            ring_state = state["rings"][str(source_id)]
+            ring.restore(ring_state["enter_time"].tolist(), [int(size) for size in ring_state["packet_size"]], [int(i) for i in ring_state["source_id"]])
+        self.count = sum(len(ring) for ring in self.rings)
+
+class StrictPriority(MultiClassBuffer):
+    # Non-preemptive: the lowest priority level with a packet waiting is
+    # served. Non-empty classes are bits of a mask ordered by level, so the
+    # next class is its lowest set bit.
+    def __init__(self, priorities):
+        super().__init__(len(priorities))
+        self.order = sorted(range(len(priorities)), key=lambda source_id: (priorities[source_id], source_id))
+        self.rank = [self.order.index(source_id) for source_id in range(len(priorities))]
+        self.mask = 0
+
+    def enqueued(self, source_id, packet_size):
+        self.mask |= 1 << self.rank[source_id]
+
+    def select(self):
+        rank = (self.mask & -self.mask).bit_length() - 1
+        source_id = self.order[rank]
+        if len(self.rings[source_id]) == 1:
+            self.mask &= self.mask - 1
+        return source_id
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.mask = 0
+        for source_id, ring in enumerate(self.rings):
+            if len(ring) > 0:
+                self.mask |= 1 << self.rank[source_id]
+
+class WeightedFairQueueing(MultiClassBuffer):
+    # Self-clocked fair queueing: a packet is tagged max(last tag of its
+    # class, tag of the packet in service) + size / weight on arrival and the
+    # smallest head tag is served next. Heads sit in a heap, O(log k).
+    def __init__(self, weights):
+        super().__init__(len(weights))
+        self.weights = [float(weight) for weight in weights]
+        self.tags = [deque() for _ in weights]
+        self.last_tag = [0.0] * len(weights)
+        self.virtual_time = 0.0
+        self.heads = []
+
+    def enqueued(self, source_id, packet_size):
+        tag = max(self.last_tag[source_id], self.virtual_time) + packet_size / self.weights[source_id]
+        self.last_tag[source_id] = tag
+        tags = self.tags[source_id]
+        tags.append(tag)
+        if len(tags) == 1:
+            heapq.heappush(self.heads, (tag, source_id))
+
+    def select(self):
+        tag, source_id = heapq.heappop(self.heads)
+        self.virtual_time = tag
+        tags = self.tags[source_id]
+        tags.popleft()
+        if tags:
+            heapq.heappush(self.heads, (tags[0], source_id))
+        return source_id
+
+    def get_state(self):
+        state = super().get_state()
+        state["tags"] = {str(source_id): list(tags) for source_id, tags in enumerate(self.tags)}
+        state["last_tag"] = self.last_tag
+        state["virtual_time"] = self.virtual_time
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.tags = [deque(float(tag) for tag in state["tags"][str(source_id)]) for source_id in range(len(self.rings))]
+        self.last_tag = [float(tag) for tag in state["last_tag"]]
+        self.virtual_time = float(state["virtual_time"])
+        self.heads = [(tags[0], source_id) for source_id, tags in enumerate(self.tags) if tags]
+        heapq.heapify(self.heads)
+
+class DeficitRoundRobin(MultiClassBuffer):
+    # Each visit to a class adds its quantum to its deficit, which pays for
+    # packets until the head no longer fits. With quanta of at least the
+    # largest packet every visit serves one, so get is O(1).
+    def __init__(self, quanta):
+        super().__init__(len(quanta))
+        self.quanta = [int(quantum) for quantum in quanta]
+        self.deficit = [0] * len(quanta)
+        self.active = deque()
+        self.visiting = False
+
+    def enqueued(self, source_id, packet_size):
+        if len(self.rings[source_id]) == 1:
+            self.active.append(source_id)
+
+    def select(self):
+        while True:
+            source_id = self.active[0]
+            if not self.visiting:
+                self.deficit[source_id] += self.quanta[source_id]
+                self.visiting = True
+            ring = self.rings[source_id]
+            packet_size = ring.peek()[1]
+            if packet_size <= self.deficit[source_id]:
+                self.deficit[source_id] -= packet_size
+                if len(ring) == 1:
+                    self.deficit[source_id] = 0
+                    self.active.popleft()
+                    self.visiting = False
+                return source_id
+            self.active.rotate(-1)
+            self.visiting = False
+
+    def get_state(self):
+        state = super().get_state()
+        state["deficit"] = self.deficit
+        state["active"] = list(self.active)
+        state["visiting"] = self.visiting
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.deficit = [int(deficit) for deficit in state["deficit"]]
+        self.active = deque(int(source_id) for source_id in state["active"])
+        self.visiting = bool(state["visiting"])
+
+def create_scheduler(name, priorities=None, weights=None, quanta=None):
+    if name == "fifo":
+        return PacketRing()
+    if name == "priority":
+        return StrictPriority(priorities)
+    if name == "wfq":
+        return WeightedFairQueueing(weights)
+    if name == "drr":
+        if min(quanta) <= 0:
+            raise ValueError("DRR quanta must be positive")
+        return DeficitRoundRobin(quanta)
+    raise ValueError(f"Unknown scheduler: {name} (expected one of {', '.join(schedulers)})")
@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+import parallel_sweep
+import simulation_project as sp
+from result_store import ResultStore
+
+# Sweep options of a scenario file; model and stopping parameters go under a
+# "model" table and default to the constants of simulation_project.
+run_options = {
+    "burstiness": list(np.arange(20.0, 101, 10)),
+    "replications": 1,
+    "seed": None,
+    "workers": None,
+    "engine": "simpy",
+    "output": "data.csv",
+    "common_random_numbers": False,
+    "antithetic": False,
+    "control_variates": False,
+    "checkpoint_dir": None,
+    "checkpoint_every": 20,
+    "resume": False,
+    "store": None,
+}
+
+def load_scenario_file(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        with open(path) as file:
+            return json.load(file)
+    if extension == ".toml":
+        import tomllib
+
+        with open(path, "rb") as file:
+            return tomllib.load(file)
+    if extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("YAML scenarios need PyYAML (pip install pyyaml); JSON and TOML work without it")
+        with open(path) as file:
+            return yaml.safe_load(file) or {}
+    raise ValueError(f"Unknown scenario format: {path} (expected .json, .toml, .yaml or .yml)")
+
+def burstiness_values(value):
+    # Either a list of values or a {start, stop, step} range with stop included.
+    if isinstance(value, dict):
+        return list(np.arange(value["start"], value["stop"] + value["step"] / 2, value["step"]))
+    return [float(burstiness) for burstiness in value]
+
+def parse_assignment(text):
+    name, separator, value = text.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError(f"Expected NAME=VALUE, got {text}")
+    try:
+        return name, json.loads(value)
+    except json.JSONDecodeError:
+        return name, value
+
+def resolve_scenario(values, overrides=None, model_overrides=None):
+    values = dict(values)
+    model = dict(values.pop("model", {}) or {})
+    unknown = set(values) - set(run_options)
+    if unknown:
+        raise ValueError(f"Unknown scenario options: {', '.join(sorted(unknown))}")
+
+    options = dict(run_options)
+    options.update(values)
+    options.update({name: value for name, value in (overrides or {}).items() if value is not None})
+    options["burstiness"] = burstiness_values(options["burstiness"])
+    model.update(model_overrides or {})
+    return options, sp.Scenario(**model)
+
+def run_scenario(options, scenario):
+    if options["engine"] == "vectorized" and (options["antithetic"] or options["control_variates"] or options["checkpoint_dir"]):
+        raise ValueError("antithetic, control_variates and checkpoint_dir need the simpy or kernel engine")
+    if options["engine"] == "vectorized" and scenario.scheduler != "fifo":
+        raise ValueError(f"the {scenario.scheduler} scheduler needs the simpy or kernel engine")
+    if options["engine"] == "vectorized" and scenario.trace is not None:
+        raise ValueError("trace replay needs the simpy or kernel engine")
+    if options["engine"] == "vectorized" and scenario.rate_schedule is not None:
+        raise ValueError("a rate schedule needs the simpy or kernel engine")
+    if scenario.rate_schedule is not None and options["control_variates"]:
+        raise ValueError("control_variates need a constant offered load, not a rate schedule")
+    if scenario.trace is not None and (options["antithetic"] or options["control_variates"]):
+        raise ValueError("antithetic and control_variates need generated traffic, not a trace")
+    if options["resume"] and not options["checkpoint_dir"]:
+        raise ValueError("resume needs checkpoint_dir")
+
+    directory = os.path.dirname(options["output"])
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    variance_reduction = sp.VarianceReduction(options["common_random_numbers"], options["antithetic"], options["control_variates"])
+    checkpointing = (options["checkpoint_dir"], options["checkpoint_every"], options["resume"]) if options["checkpoint_dir"] else None
+    store = ResultStore(options["store"]) if options["store"] else None
+    parallel_sweep.run_sweep(options["burstiness"], options["replications"], options["seed"], options["workers"], options["engine"],
+                             options["output"], variance_reduction, checkpointing, scenario, store)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a burstiness sweep described by a scenario file and/or command-line flags.")
+    parser.add_argument("scenario", nargs="?", default=None, help="scenario file (.json, .toml, .yaml)")
+    parser.add_argument("--burstiness", type=float, nargs="+", default=None)
+    parser.add_argument("--replications", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--engine", choices=["simpy", "kernel", "vectorized"], default=None)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--common-random-numbers", action="store_true", default=None)
+    parser.add_argument("--antithetic", action="store_true", default=None)
+    parser.add_argument("--control-variates", action="store_true", default=None)
+    parser.add_argument("--checkpoint-dir", default=None)
+    parser.add_argument("--checkpoint-every", type=int, default=None)
+    parser.add_argument("--resume", action="store_true", default=None)
+    parser.add_argument("--store", default=None, help="result store directory: cached points are reused and new ones added")
+    parser.add_argument("--set", type=parse_assignment, action="append", default=[], metavar="NAME=VALUE",
+                        help="override a model parameter, e.g. --set confidence_threshold=0.1 (value parsed as JSON)")
+    parser.add_argument("--print", action="store_true", help="print the resolved scenario as JSON and exit")
+    args = parser.parse_args(argv)
+
+    values = load_scenario_file(args.scenario) if args.scenario else {}
+    overrides = {name: getattr(args, name) for name in run_options}
+    try:
+        options, scenario = resolve_scenario(values, overrides, dict(args.set))
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.print:
+        print(json.dumps({**options, "burstiness": [float(b) for b in options["burstiness"]], "model": scenario.to_dict()}, indent=2))
+        return
+    try:
+        run_scenario(options, scenario)
+    except ValueError as error:
+        parser.error(str(error))
+
+if __name__ == "__main__":
+    main()
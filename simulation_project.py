@@ -1,285 +1,937 @@
 import csv
-import simpy
-import random
-import queue
+import json
 import math
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
+
+from packet_ring import PacketRing
+from metrics_recorder import ColumnRecorder
+from batch_means import BatchMeans
+from event_kernel import create_environment
+from checkpoint import rng_state, set_rng_state
+from schedulers import create_scheduler
+from traces import Trace
+from rate_schedule import create_schedule
 
 class QueueClass(object):
-    def __init__(self, env, service_rate):
+    def __init__(self, env, service_rate, persistent_server=True, buffer=None):
+        # buffer is a FIFO PacketRing unless a multi-class scheduler is given.
         self.env = env
         self.service_rate = service_rate
-        self.buffer = queue.Queue()
+        self.buffer = buffer if buffer is not None else PacketRing()
+        self.sources = []
         self.in_service = 0
+        self.persistent_server = persistent_server
+        self.wake_up = None
+        self.current = None
+        self.done_time = None
+        if persistent_server:
+            self.server = env.process(self.serve())
+
+    def register(self, source):
+        self.sources.append(source)
+        return len(self.sources) - 1
 
     def service(self):
-        pkt = self.buffer.get()
-        service_time = float(pkt.packet_size / self.service_rate)
+        enter_time, packet_size, source_id = self.buffer.get()
+        service_time = float(packet_size / self.service_rate)
         yield self.env.timeout(service_time) 
-        pkt.acknowledge()
-        del pkt
+        self.sources[source_id].acknowledge(enter_time)
 
-        if self.buffer.qsize() > 0:
+        if len(self.buffer) > 0:
             self.env.process(self.service())
         else:
             self.in_service = 0
 
-    def reception(self, pkt):
-        self.buffer.put(pkt)
-        pkt.enter_time = self.env.now
+    def serve(self):
+        if self.current is not None:
+            # Restored from a snapshot in the middle of a service.
+            yield self.env.timeout(self.done_time - self.env.now)
+            self.finish()
+
+        while True:
+            if len(self.buffer) == 0:
+                self.in_service = 0
+                self.wake_up = self.env.event()
+                yield self.wake_up
+
+            self.current = self.buffer.get()
+            service_time = float(self.current[1] / self.service_rate)
+            self.done_time = self.env.now + service_time
+            yield self.env.timeout(service_time)
+            self.finish()
+
+    def finish(self):
+        enter_time, _, source_id = self.current
+        self.current = None
+        self.sources[source_id].acknowledge(enter_time)
+
+    def reception(self, source_id, packet_size):
+        self.buffer.put(self.env.now, packet_size, source_id)
         if self.in_service == 0:
             self.in_service = 1
-            self.env.process(self.service())
+            if not self.persistent_server:
+                self.env.process(self.service())
+            elif self.wake_up is not None:
+                self.wake_up.succeed()
+                self.wake_up = None
+
+    def get_state(self):
+        if not self.persistent_server:
+            raise ValueError("Snapshots need the persistent server process")
+        if isinstance(self.buffer, PacketRing):
+            enter_time, packet_size, source_id = self.buffer.snapshot()
+            state = {"enter_time": enter_time, "packet_size": packet_size, "source_id": source_id}
+        else:
+            state = {"scheduler": self.buffer.get_state()}
+        state["serving"] = self.current is not None
+        if self.current is not None:
+            state["current_enter_time"], state["current_packet_size"], state["current_source_id"] = self.current
+            state["done_time"] = self.done_time
+        return state
+
+    def set_state(self, state):
+        if isinstance(self.buffer, PacketRing):
+            self.buffer.restore(state["enter_time"].tolist(), state["packet_size"].tolist(), state["source_id"].tolist())
+        else:
+            self.buffer.set_state(state["scheduler"])
+        if bool(state["serving"]):
+            self.current = (float(state["current_enter_time"]), int(state["current_packet_size"]), int(state["current_source_id"]))
+            self.done_time = float(state["done_time"])
+            self.in_service = 1
+
+class VariateBuffer(object):
+    def __init__(self, draw, buffer_size):
+        self.draw = draw
+        self.buffer_size = buffer_size
+        self.values = []
+        self.index = 0
+
+    def next(self):
+        if self.index >= len(self.values):
+            self.values = self.draw(self.buffer_size)
+            self.index = 0
+        value = self.values[self.index]
+        self.index += 1
+        return value
+
+class ResponseTimeStatistics(object):
+    @property
+    def block_means(self):
+        return self.estimator.history
+
+    def get_average_response_time(self):
+        average = self.estimator.average()
+        if average is None:
+            return 1
 
-class Source(object):
-    def __init__(self, env, queue, rate, result):
+        if self.control_variates:
+            average -= control_variate_fit(self.block_means, self.control_blocks(), self.offered_rate)[0]
+        return average
+
+    def calculate_confidence_interval(self):
+        if self.control_variates:
+            return control_variate_interval(self.block_means, self.control_blocks(), self.offered_rate, self.env.now, self.estimator.block_length)
+
+        if self.estimator.count <= 1:
+            return 1
+
+        return self.estimator.half_width(self.env.now)
+
+    def get_total_processed_packet(self):
+        return self.estimator.total_count()
+
+    def get_total_response_time(self):
+        return self.estimator.total_sum()
+
+class Source(ResponseTimeStatistics):
+    def __init__(self, env, queue, rate, result, rng=None, buffer_size=65536):
         self.env = env
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.buffer_size = buffer_size
         self.queue = queue
         self.rate = rate
         self.sent_packet = 0
-        self.processed_packet = 0
-        self.total_response_time = 0
-        self.processed_packet_block = 0 
-        self.response_time_block = 0
-        self.interval_count = 0
-        self.z = 0  
-        self.z_square = 0
+        self.estimator = BatchMeans(result.block_length, keep_history=True)
+        self.antithetic = False
+        self.control_variates = False
         self.result = result
+        self.variates = None
+        self.refill_state = None
+        self.wake_time = None
+        self.schedule = None
+        self.source_id = queue.register(self)
         self.action = env.process(self.run())
 
     def run(self):
+        # start() plans the first wait and wake() acts when it ends and plans
+        # the next one. A source restored from a snapshot skips start() and
+        # sleeps until the wake-up time it was saved with.
+        if self.wake_time is None:
+            delay = self.start()
+        else:
+            delay = self.wake_time - self.env.now
+        while True:
+            self.wake_time = self.env.now + delay
+            yield self.env.timeout(delay)
+            delay = self.wake()
+
+    def start(self):
         pass
 
-    def acknowledge(self, enter_time):
-        self.processed_packet += 1
-        self.result.total_processed_packet += 1
-        new_response_time = self.env.now - enter_time
-        self.total_response_time += new_response_time
-        self.result.total_response_time += new_response_time
-        self.check_confidence_interval(new_response_time)
-
-    def check_confidence_interval(self, new_response_time):
-        if  (self.env.now - block_size * self.interval_count) > block_size:
-            new_zi = self.response_time_block / self.processed_packet_block
-            self.z += new_zi
-            self.z_square += math.pow(new_zi, 2)
-            self.processed_packet_block = 0
-            self.response_time_block = 0
-            self.interval_count += 1
-
-        self.processed_packet_block += 1
-        self.response_time_block += new_response_time
-
-        self.result.check_confidence_interval(new_response_time)
+    def wake(self):
+        pass
 
-    def get_average_response_time(self):
-        if self.processed_packet <= 0:
-            return 1
+    def send(self, packet_size):
+        self.queue.reception(self.source_id, packet_size)
+        self.sent_packet += 1
+        self.result.total_sent_packet += 1
+        self.result.offered_bits_block += packet_size
 
-        return float(self.total_response_time / self.processed_packet)
+    def uniforms(self, count):
+        values = self.rng.random(count)
+        if self.antithetic:
+            values = 1.0 - values
+        return np.minimum(values, 1.0 - 2.0 ** -53)
 
-    def calculate_confidence_interval(self):
-        if self.interval_count <= 1: 
-            return 1
+    def acknowledge(self, enter_time):
+        now = self.env.now
+        new_response_time = now - enter_time
+        self.estimator.add(now, new_response_time)
+        self.result.acknowledge(now, new_response_time)
 
-        standard_deviation = math.sqrt((1 / (self.interval_count - 1)) * (self.z_square - (math.pow(self.z, 2) / self.interval_count)))
-        epsilon_torque = 4.5 * standard_deviation
-        epsilon_total = epsilon_torque * math.sqrt(block_size / self.env.now)
+    @property
+    def offered_rate(self):
+        return self.result.offered_rate
+
+    def control_blocks(self):
+        return self.result.block_loads
 
-        return epsilon_total
-    
-    def get_total_processed_packet(self):
-        return self.processed_packet
-    
     def get_total_sent_packet(self):
         return self.sent_packet
-    
+
+    def refill(self, count):
+        # Keeps the generator state each variate buffer is drawn from, so a
+        # snapshot stores that state and a read position instead of the buffer.
+        self.refill_state = self.rng.bit_generator.state
+        return self.draw(count)
+
+    def get_state(self):
+        state = {"sent_packet": self.sent_packet, "wake_time": self.wake_time, "rng": rng_state(self.rng), "estimator": self.estimator.get_state()}
+        if self.variates is not None and self.refill_state is not None:
+            state["variates"] = {"rng": json.dumps(self.refill_state), "index": self.variates.index, "length": len(self.variates.values)}
+        return state
+
+    def set_state(self, state):
+        self.sent_packet = int(state["sent_packet"])
+        self.wake_time = float(state["wake_time"])
+        self.estimator.set_state(state["estimator"])
+        if "variates" in state:
+            self.variates = VariateBuffer(self.refill, self.buffer_size)
+            set_rng_state(self.rng, state["variates"]["rng"])
+            self.variates.values = self.refill(int(state["variates"]["length"]))
+            self.variates.index = int(state["variates"]["index"])
+        set_rng_state(self.rng, state["rng"])
+
 class DataSource(Source):
-    def run(self):
-        while True:
-            packet_size = self.get_packet_size()
-            sending_time = np.random.exponential(packet_size / self.rate)
-            yield self.env.timeout(sending_time)
-            new_packet = Packet(self, packet_size)
-            self.queue.reception(new_packet)
-            self.sent_packet += 1
-            self.result.total_sent_packet += 1
-        
-    def get_packet_size(self):
-        percentage = random.randint(1, 100)
-        if percentage <= 40:
-            return 400
-        elif percentage > 40 and percentage <= 70:
-            return 4000
+    def __init__(self, env, queue, rate, result, rng=None, buffer_size=65536, packet_sizes=None, packet_size_probabilities=None, schedule=None):
+        self.packet_sizes = list(packet_sizes if packet_sizes is not None else data_packet_sizes)
+        self.packet_size_probabilities = list(packet_size_probabilities if packet_size_probabilities is not None else data_packet_size_probabilities)
+        self.percentiles = np.round(np.cumsum(self.packet_size_probabilities) * 100)
+        super().__init__(env, queue, rate, result, rng, buffer_size)
+        self.schedule = schedule
+
+    def start(self):
+        if self.buffer_size:
+            self.variates = VariateBuffer(self.refill, self.buffer_size)
+        return self.plan()
+
+    def wake(self):
+        self.send(self.pending_packet_size)
+        return self.plan()
+
+    def plan(self):
+        if self.variates is not None:
+            self.pending_packet_size, sending_time = self.variates.next()
         else:
-            return 12000
-        
+            self.pending_packet_size = self.get_packet_size()
+            sending_time = self.rng.exponential(self.pending_packet_size / self.rate)
+        if self.schedule is not None:
+            return self.thin(sending_time)
+        return sending_time
+
+    def thin(self, sending_time):
+        # Candidates come at the peak rate of the schedule and each is kept
+        # with probability rate(t) / peak rate. The packet size is kept through
+        # the rejected ones, so the gap is that of a Poisson process at the
+        # scheduled rate for packets of this size, as with a constant rate.
+        peak = self.schedule.peak
+        mean = self.pending_packet_size / (self.rate * peak)
+        delay = sending_time / peak
+        while self.uniforms(1)[0] * peak > self.schedule.factor(self.env.now + delay):
+            delay += mean * -math.log1p(-self.uniforms(1)[0])
+        return delay
+
+    def get_state(self):
+        state = super().get_state()
+        state["pending_packet_size"] = self.pending_packet_size
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.pending_packet_size = int(state["pending_packet_size"])
+
+    def get_packet_size(self):
+        percentage = self.rng.integers(1, 101)
+        return self.packet_sizes[int(np.searchsorted(self.percentiles, percentage))]
+
+    def draw(self, count):
+        # Inverse-transform sampling, so an antithetic twin mirrors every draw.
+        size_index = np.searchsorted(np.cumsum(self.packet_size_probabilities), self.uniforms(count), side="right")
+        packet_sizes = np.asarray(self.packet_sizes)[np.minimum(size_index, len(self.packet_sizes) - 1)]
+        sending_times = packet_sizes / self.rate * -np.log1p(-self.uniforms(count))
+        return list(zip(packet_sizes.tolist(), sending_times.tolist()))
+
 class VoiceSource(Source):
-    def __init__(self, env, queue, packet_size, rate, result):
-        super().__init__(env, queue, rate, result)
+    def __init__(self, env, queue, packet_size, rate, result, rng=None, buffer_size=65536, schedule=None):
+        super().__init__(env, queue, rate, result, rng, buffer_size)
         self.packet_size = packet_size
+        self.sending_time = float(packet_size / rate)
+        self.schedule = schedule
 
-    def run(self):
-        sending_time = float(self.packet_size / self.rate)
-        while True:
-            yield self.env.timeout(sending_time)
-            new_packet = Packet(self, self.packet_size)
-            self.queue.reception(new_packet)
-            self.sent_packet += 1    
-            self.result.total_sent_packet += 1 
+    def start(self):
+        return self.gap()
+
+    def wake(self):
+        self.send(self.packet_size)
+        return self.gap()
+
+    def gap(self):
+        # Constant bit rate, at the rate scheduled when the packet is sent.
+        if self.schedule is not None:
+            return self.sending_time / self.schedule.factor(self.env.now)
+        return self.sending_time
 
 class VideoSource(Source):
-    def __init__(self, env, queue, packet_size, burstiness, rate, on_time_average, result):
-        super().__init__(env, queue, rate, result)
+    def __init__(self, env, queue, packet_size, burstiness, rate, on_time_average, result, event_driven=True, rng=None, buffer_size=65536, schedule=None):
+        super().__init__(env, queue, rate, result, rng, buffer_size)
+        self.schedule = schedule
         self.packet_size = packet_size
         self.burstiness = burstiness
         self.on_time_average = on_time_average
-    
+        self.event_driven = event_driven
+        self.off_poll_interval = 0.00001
+        self.sending_time = float(packet_size / float(burstiness * rate))
+        self.off_time_average = float(burstiness * on_time_average) - on_time_average
+        self.is_on = False
+        self.burst_remaining = 0
+
     def run(self):
+        if self.event_driven:
+            yield from super().run()
+        else:
+            yield from self.run_polling()
+
+    def run_polling(self):
         peak_rate = float(self.burstiness * self.rate)
         sending_time = float(self.packet_size / peak_rate)
-        off_time_average = float(self.burstiness * self.on_time_average) - self.on_time_average
         is_on = True
-        state_time = np.random.exponential(self.on_time_average)
+        state_time = self.rng.exponential(self.on_time_average)
         init_time = self.env.now
         while True:
             if is_on:
                 if self.env.now - init_time >= state_time:
                     is_on = False
-                    state_time = np.random.exponential(off_time_average)
+                    state_time = self.rng.exponential(self.off_time_mean())
                     init_time = self.env.now
                 else:
                     yield self.env.timeout(sending_time)
-                    new_packet = Packet(self, self.packet_size)
-                    self.queue.reception(new_packet)
-                    self.sent_packet += 1
-                    self.result.total_sent_packet += 1
+                    self.send(self.packet_size)
             else:
                 if self.env.now - init_time >= state_time:
                     is_on = True
-                    state_time = np.random.exponential(self.on_time_average)
+                    state_time = self.rng.exponential(self.on_time_average)
                     init_time = self.env.now
                 else:
-                    yield self.env.timeout(0.00001)
-
-class Packet(object):
-    def __init__(self, source, packet_size):
-        self.source = source
-        self.packet_size = packet_size
-        self.enter_time = 0
-
-    def acknowledge(self):
-        self.source.acknowledge(self.enter_time)
+                    yield self.env.timeout(self.off_poll_interval)
+
+    def start(self):
+        if self.buffer_size:
+            self.variates = VariateBuffer(self.refill, self.buffer_size)
+        return self.next_period()
+
+    def wake(self):
+        if self.is_on:
+            self.send(self.packet_size)
+            self.burst_remaining -= 1
+            if self.burst_remaining > 0:
+                return self.sending_time
+        return self.next_period()
+
+    def next_period(self):
+        # Same ON/OFF process as run_polling, but each period is planned when it
+        # starts: an ON period of length T emits ceil(T / sending_time) packets and
+        # an OFF period lasts as long as the polling loop would have kept spinning.
+        while True:
+            if self.is_on:
+                self.is_on = False
+                off_duration = math.ceil(self.exponential(self.off_time_mean()) / self.off_poll_interval) * self.off_poll_interval
+                if off_duration > 0:
+                    return off_duration
+            else:
+                self.is_on = True
+                self.burst_remaining = math.ceil(self.exponential(self.on_time_average) / self.sending_time)
+                if self.burst_remaining > 0:
+                    return self.sending_time
+
+    def off_time_mean(self):
+        # Bursts keep the peak rate and length; the scheduled rate sets the
+        # mean OFF period at the start of each, so that the mean rate is
+        # factor * rate, up to the peak rate once factor reaches burstiness.
+        if self.schedule is None:
+            return self.off_time_average
+        factor = self.schedule.factor(self.env.now)
+        return self.on_time_average * max(self.burstiness / factor - 1, 0.0)
+
+    def exponential(self, scale):
+        if self.variates is not None:
+            return scale * self.variates.next()
+        return self.rng.exponential(scale)
+
+    def mean_rate(self):
+        # Long-run rate of the ON/OFF process as discretized by next_period,
+        # which differs from rate: ceil(X / sending_time) packets and
+        # ceil(Y / off_poll_interval) polls are geometric for exponential X, Y.
+        packets = 1 / -math.expm1(-self.sending_time / self.on_time_average)
+        off_duration = 0.0
+        if self.off_time_average > 0:
+            off_duration = self.off_poll_interval / -math.expm1(-self.off_poll_interval / self.off_time_average)
+        return self.packet_size * packets / (packets * self.sending_time + off_duration)
+
+    def draw(self, count):
+        return (-np.log1p(-self.uniforms(count))).tolist()
+
+    def get_state(self):
+        if not self.event_driven:
+            raise ValueError("Snapshots need the event-driven video source")
+        state = super().get_state()
+        state["is_on"] = self.is_on
+        state["burst_remaining"] = self.burst_remaining
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.is_on = bool(state["is_on"])
+        self.burst_remaining = int(state["burst_remaining"])
+
+class TraceSource(Source):
+    # Replays the packets of one class of a recorded Trace at their recorded
+    # times, counted from the first packet of the trace. The trace is read a
+    # window of buffer_size records at a time and the process ends with it.
+    def __init__(self, env, queue, trace, trace_class, result, buffer_size=65536):
+        self.trace = trace
+        self.trace_class = trace_class
+        self.window_start = 0
+        self.position = 0
+        self.times = []
+        self.sizes = []
+        self.index = 0
+        self.finished = False
+        self.pending_packet_size = None
+        super().__init__(env, queue, 0, result, buffer_size=buffer_size or 65536)
 
-class Result(object):
-    def __init__(self, env):
+    def run(self):
+        if self.finished:
+            return
+        if self.wake_time is None:
+            delay = self.start()
+        else:
+            delay = self.wake_time - self.env.now
+        while delay is not None:
+            self.wake_time = self.env.now + delay
+            yield self.env.timeout(delay)
+            delay = self.wake()
+        self.finished = True
+
+    def start(self):
+        return self.plan()
+
+    def wake(self):
+        self.send(self.pending_packet_size)
+        return self.plan()
+
+    def plan(self):
+        while self.index >= len(self.times):
+            if self.position >= len(self.trace):
+                return None
+            self.load_window(self.position)
+        time = self.times[self.index]
+        self.pending_packet_size = self.sizes[self.index]
+        self.index += 1
+        return max(time - self.env.now, 0.0)
+
+    def load_window(self, start):
+        records = self.trace.window(start, self.buffer_size)
+        selected = records[records["source_id"] == self.trace_class]
+        self.window_start = start
+        self.position = start + len(records)
+        self.times = (selected["time"] - self.trace.start_time).tolist()
+        self.sizes = selected["size"].tolist()
+        self.index = 0
+
+    def get_state(self):
+        state = super().get_state()
+        state["finished"] = self.finished
+        state["window_start"] = self.window_start
+        state["index"] = self.index
+        if self.pending_packet_size is not None:
+            state["pending_packet_size"] = self.pending_packet_size
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.finished = bool(state["finished"])
+        self.load_window(int(state["window_start"]))
+        self.index = int(state["index"])
+        if "pending_packet_size" in state:
+            self.pending_packet_size = int(state["pending_packet_size"])
+
+class Result(ResponseTimeStatistics):
+    def __init__(self, env, block_length=50):
         self.env = env
-        self.total_response_time = 0
-        self.total_processed_packet = 0
+        self.block_length = block_length
         self.total_sent_packet = 0
-        self.interval_count = 0
-        self.z = 0
-        self.z_square = 0
+        self.estimator = BatchMeans(block_length, keep_history=True)
+        self.control_variates = False
 
-        self.processed_packet_block = 0
-        self.response_time_block = 0
+        self.offered_rate = 0
+        self.offered_bits_block = 0
+        self.block_start = 0
+        self.block_loads = []
 
-    def check_confidence_interval(self, new_response_time):
-        if  (self.env.now - block_size * self.interval_count) > block_size:
-            new_zi = self.response_time_block / self.processed_packet_block
-            self.z += new_zi
-            self.z_square += math.pow(new_zi, 2)
-            self.processed_packet_block = 0
-            self.response_time_block = 0
-            self.interval_count += 1
+    def acknowledge(self, now, new_response_time):
+        if now >= self.estimator.next_boundary and self.estimator.block_count > 0:
+            self.block_loads.append(self.offered_bits_block / (now - self.block_start))
+            self.offered_bits_block = 0
+            self.block_start = now
+        self.estimator.add(now, new_response_time)
 
-        self.processed_packet_block += 1
-        self.response_time_block += new_response_time
+    def control_blocks(self):
+        return self.block_loads
+
+    def get_total_sent_packet(self):
+        return self.total_sent_packet
+
+    def get_state(self):
+        return {"total_sent_packet": self.total_sent_packet, "offered_bits_block": self.offered_bits_block, "block_start": self.block_start,
+                "block_loads": np.asarray(self.block_loads, dtype=float), "estimator": self.estimator.get_state()}
+
+    def set_state(self, state):
+        self.total_sent_packet = int(state["total_sent_packet"])
+        self.offered_bits_block = int(state["offered_bits_block"])
+        self.block_start = float(state["block_start"])
+        self.block_loads = state["block_loads"].tolist()
+        self.estimator.set_state(state["estimator"])
+
+class AntitheticPair(object):
+    # Estimator over a model and its antithetic twin running in the same
+    # environment: block means are averaged pairwise before the CI is taken.
+    def __init__(self, primary, twin):
+        self.primary = primary
+        self.twin = twin
+        self.env = primary.env
+        self.control_variates = primary.control_variates
+        self.offered_rate = primary.offered_rate
+        self.block_length = primary.estimator.block_length
+
+    def paired(self, primary_values, twin_values):
+        count = min(len(primary_values), len(twin_values))
+        return (np.asarray(primary_values[:count]) + np.asarray(twin_values[:count])) / 2
+
+    def control_blocks(self):
+        return self.paired(self.primary.control_blocks(), self.twin.control_blocks())
 
     def get_average_response_time(self):
-        if self.total_processed_packet <= 0:
+        processed_packet = self.get_total_processed_packet()
+        if processed_packet <= 0:
             return 1
 
-        return float(self.total_response_time / self.total_processed_packet)
+        average = float((self.primary.get_total_response_time() + self.twin.get_total_response_time()) / processed_packet)
+        if self.control_variates:
+            average -= control_variate_fit(self.paired(self.primary.block_means, self.twin.block_means), self.control_blocks(), self.offered_rate)[0]
+        return average
 
     def calculate_confidence_interval(self):
-        if self.interval_count <= 1: 
+        block_means = self.paired(self.primary.block_means, self.twin.block_means)
+        if self.control_variates:
+            return control_variate_interval(block_means, self.control_blocks(), self.offered_rate, self.env.now, self.block_length)
+
+        if len(block_means) <= 1:
             return 1
 
-        standard_deviation = math.sqrt((1 / (self.interval_count - 1)) * (self.z_square - (math.pow(self.z, 2) / self.interval_count)))
-        epsilon_torque = 4.5 * standard_deviation
-        epsilon_total = epsilon_torque * math.sqrt(block_size / self.env.now)
+        return 4.5 * float(np.std(block_means, ddof=1)) * math.sqrt(self.block_length / self.env.now)
+
+    def get_total_processed_packet(self):
+        return self.primary.get_total_processed_packet() + self.twin.get_total_processed_packet()
 
-        return epsilon_total
+    def get_total_sent_packet(self):
+        return self.primary.get_total_sent_packet() + self.twin.get_total_sent_packet()
+
+    def get_total_response_time(self):
+        return self.primary.get_total_response_time() + self.twin.get_total_response_time()
+
+class VarianceReduction(object):
+    def __init__(self, common_random_numbers=False, antithetic=False, control_variates=False):
+        self.common_random_numbers = common_random_numbers
+        self.antithetic = antithetic
+        self.control_variates = control_variates
+
+def control_variate_fit(block_means, block_loads, offered_rate):
+    # Regress block means on the block offered load, whose mean is known, and
+    # return the correction to subtract from the estimate and the residual
+    # standard deviation of the block means.
+    count = min(len(block_means), len(block_loads))
+    if count <= 2:
+        return 0, None
+
+    z = np.asarray(block_means[:count], dtype=float)
+    c = np.asarray(block_loads[:count], dtype=float)
+    dz = z - z.mean()
+    dc = c - c.mean()
+    variance = float(np.dot(dc, dc))
+    beta = float(np.dot(dc, dz)) / variance if variance > 0 else 0.0
+    residual = dz - beta * dc
+    standard_deviation = math.sqrt(float(np.dot(residual, residual)) / (count - 2))
+    return float(beta * (c.mean() - offered_rate)), standard_deviation
+
+def control_variate_interval(block_means, block_loads, offered_rate, now, block_length):
+    _, standard_deviation = control_variate_fit(block_means, block_loads, offered_rate)
+    if standard_deviation is None:
+        return 1
+
+    return 4.5 * standard_deviation * math.sqrt(block_length / now)
 class PandaFrameResponseTime(object):
-    def __init__(self):
+    def __init__(self, spill_dir=None):
         self.source_id_column = "source_id"
         self.burstiness_column = "burstiness"
         self.response_time_column = "response_time"
 
-        self.df = pd.DataFrame(columns=[self.source_id_column, self.burstiness_column, self.response_time_column])
+        self.recorder = ColumnRecorder({self.source_id_column: "category", self.burstiness_column: "f8", self.response_time_column: "f8"},
+                                       spill_dir=spill_dir, prefix="response_times")
 
     def add_data(self, source_id, burstiness, response_time):
-        self.df.loc[len(self.df)] = {self.source_id_column: source_id, self.burstiness_column: burstiness, self.response_time_column: response_time}
+        self.recorder.append(source_id, burstiness, response_time)
+
+    @property
+    def df(self):
+        return self.recorder.to_frame()
 
     def print_data(self, source_id):
-        plt.plot(self.df[self.df[self.source_id_column] == source_id][self.burstiness_column], self.df[self.df[self.source_id_column] == source_id][self.response_time_column], linewidth=1, label=source_id)
+        import matplotlib.pyplot as plt
+
+        df = self.df
+        plt.plot(df[df[self.source_id_column] == source_id][self.burstiness_column], df[df[self.source_id_column] == source_id][self.response_time_column], linewidth=1, label=source_id)
+
+class ResponseTimeSeries(object):
+    # Mean response time, served and sent packets of every source and of the
+    # total over consecutive windows, from the running totals read at each
+    # window end, so the packets themselves are not touched. factor is the
+    # load factor of the schedule at the window start.
+    def __init__(self, env, sources, result, window, schedule=None):
+        self.env = env
+        self.window = window
+        self.schedule = schedule
+        self.estimators = dict(sources)
+        self.estimators["Total"] = result
+        self.recorder = ColumnRecorder({"source": "category", "start": "f8", "factor": "f8", "response_time": "f8",
+                                        "processed_packet": "i8", "sent_packet": "i8"})
+        self.start = env.now
+        self.last = None
+        self.action = env.process(self.run())
+
+    def totals(self):
+        return {name: (estimator.get_total_processed_packet(), estimator.get_total_response_time(), estimator.get_total_sent_packet())
+                for name, estimator in self.estimators.items()}
 
-def check_stopping_condition(env, burstiness, sources, result):
+    def run(self):
+        self.start = self.env.now
+        self.last = self.totals()
+        while True:
+            yield self.env.timeout(self.window)
+            self.record()
+
+    def record(self):
+        factor = self.schedule.factor(self.start) if self.schedule is not None else 1.0
+        current = self.totals()
+        for name, (processed, total, sent) in current.items():
+            count = processed - self.last[name][0]
+            mean = (total - self.last[name][1]) / count if count > 0 else math.nan
+            self.recorder.append(name, self.start, factor, mean, count, sent - self.last[name][2])
+        self.start = self.env.now
+        self.last = current
+
+    def flush(self):
+        # Records the window cut short by the end of the run.
+        if self.env.now > self.start:
+            self.record()
+
+    @property
+    def df(self):
+        return self.recorder.to_frame()
+
+class Scenario(object):
+    # Model and stopping parameters of one run. Anything not given takes the
+    # value of the module constant of the same name.
+    parameters = ["min_simulation_duration", "max_simulation_duration", "block_size", "confidence_threshold", "adaptive_stopping", "variate_buffer_size",
+                  "scheduler", "scheduler_priorities", "scheduler_weights", "scheduler_quanta", "trace", "rate_schedule",
+                  "service_rate", "data_rate", "data_packet_sizes", "data_packet_size_probabilities", "voice_packet_size", "voice_rate",
+                  "video_packet_size", "video_rate", "video_on_time_average"]
+
+    def __init__(self, **values):
+        unknown = set(values) - set(self.parameters)
+        if unknown:
+            raise ValueError(f"Unknown scenario parameters: {', '.join(sorted(unknown))}")
+        for name in self.parameters:
+            setattr(self, name, values.get(name, globals()[name]))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.parameters}
+
+class AdaptiveStopping(object):
+    # Rule of Results/rules.txt: a relative half-width eps1 reached at t1
+    # becomes eps2 at t2 = t1 (eps1 / eps2)^2. Every source gets the horizon it
+    # needs for the threshold and the next check is scheduled at the furthest
+    # one, in whole blocks and at most growth times the current time away,
+    # since early half-widths are poor predictors.
+    def __init__(self, scenario, growth=4.0):
+        self.scenario = scenario
+        self.growth = growth
+
+    def projected_horizon(self, now, ratio):
+        if not math.isfinite(ratio):
+            return math.inf
+        return now * (ratio / self.scenario.confidence_threshold) ** 2
+
+    def next_check_blocks(self, now, ratios):
+        scenario = self.scenario
+        target = max([self.projected_horizon(now, ratio) for ratio in ratios] + [scenario.min_simulation_duration])
+        target = min(target, max(now * self.growth, now + scenario.block_size), scenario.max_simulation_duration)
+        return max(1, math.ceil((target - now) / scenario.block_size - 1e-9))
+
+    def report(self, now, names, ratios):
+        horizons = [self.projected_horizon(now, ratio) for ratio in ratios]
+        slowest = int(np.argmax(horizons))
+        for i, (name, ratio, horizon) in enumerate(zip(names, ratios, horizons)):
+            remaining = max(horizon - now, 0)
+            print(f"Time {now:.2f}: {name}: {ratio:.4f} for {self.scenario.confidence_threshold}, needs ~{horizon:.0f} ({remaining:.0f} more){' <- slowest' if i == slowest else ''}")
+        return list(zip(names, ratios, horizons))
+
+def result_row(env, burstiness, sources, result, ratios):
+    return [burstiness, env.now, 
+            sources['Data Source'].get_average_response_time(), 
+            sources['Voice Source'].get_average_response_time(), 
+            sources['Video Source'].get_average_response_time(), 
+            result.get_average_response_time(), 
+            sources['Data Source'].get_total_sent_packet(), 
+            sources['Voice Source'].get_total_sent_packet(), 
+            sources['Video Source'].get_total_sent_packet(), 
+            result.get_total_sent_packet(), 
+            sources['Data Source'].get_total_processed_packet(), 
+            sources['Voice Source'].get_total_processed_packet(), 
+            sources['Video Source'].get_total_processed_packet(), 
+            result.get_total_processed_packet()] + list(ratios)
+
+def check_stopping_condition(env, burstiness, sources, result, verbose=True, checkpoint=None, resume_blocks=None, scenario=None):
+    # Checks every block, or with scenario.adaptive_stopping at the blocks
+    # AdaptiveStopping schedules. checkpoint(blocks) is called with the blocks
+    # left until the next check and returns how many to wait before it is
+    # called again. A resumed run first waits the blocks its snapshot recorded.
+    if scenario is None:
+        scenario = Scenario()
+
+    def wait(blocks):
+        while blocks > 0:
+            step = checkpoint(blocks) if checkpoint is not None else blocks
+            yield env.timeout(step * scenario.block_size)
+            blocks -= step
+
+    controller = AdaptiveStopping(scenario) if scenario.adaptive_stopping else None
+    # A replayed trace has no data past its last packet, so the run ends with it.
+    trace_sources = [source for source in (getattr(source, "primary", source) for source in sources.values()) if isinstance(source, TraceSource)]
+    if resume_blocks is not None:
+        yield from wait(resume_blocks)
     while True:
         confidence_data_source = sources['Data Source'].calculate_confidence_interval() / sources['Data Source'].get_average_response_time()
         confidence_voice_source = sources['Voice Source'].calculate_confidence_interval() / sources['Voice Source'].get_average_response_time()
         confidence_video_source = sources['Video Source'].calculate_confidence_interval() / sources['Video Source'].get_average_response_time()
         confidence_total = result.calculate_confidence_interval() / result.get_average_response_time()
+        ratios = [confidence_data_source, confidence_voice_source, confidence_video_source, confidence_total]
 
-        print(f"Time {env.now:.2f}: Confidence Data Source: {confidence_data_source}")
-        print(f"Time {env.now:.2f}: Confidence Voice Source: {confidence_voice_source}")
-        print(f"Time {env.now:.2f}: Confidence Video Source: {confidence_video_source}")
-        print(f"Time {env.now:.2f}: Confidence Total: {confidence_total}")
-
-        if env.now < min_simulation_duration:
-            yield env.timeout(block_size)
-            continue
+        if verbose:
+            print(f"Time {env.now:.2f}: Confidence Data Source: {confidence_data_source}")
+            print(f"Time {env.now:.2f}: Confidence Voice Source: {confidence_voice_source}")
+            print(f"Time {env.now:.2f}: Confidence Video Source: {confidence_video_source}")
+            print(f"Time {env.now:.2f}: Confidence Total: {confidence_total}")
 
         if (
-            confidence_data_source < confidence_threshold and
-            confidence_voice_source < confidence_threshold and
-            confidence_video_source < confidence_threshold and
-            confidence_total < confidence_threshold
+            env.now >= scenario.min_simulation_duration and
+            confidence_data_source < scenario.confidence_threshold and
+            confidence_voice_source < scenario.confidence_threshold and
+            confidence_video_source < scenario.confidence_threshold and
+            confidence_total < scenario.confidence_threshold
         ):
-            data = [burstiness, env.now, 
-                    sources['Data Source'].get_average_response_time(), 
-                    sources['Voice Source'].get_average_response_time(), 
-                    sources['Video Source'].get_average_response_time(), 
-                    result.get_average_response_time(), 
-                    sources['Data Source'].get_total_sent_packet(), 
-                    sources['Voice Source'].get_total_sent_packet(), 
-                    sources['Video Source'].get_total_sent_packet(), 
-                    result.total_sent_packet, 
-                    sources['Data Source'].get_total_processed_packet(), 
-                    sources['Voice Source'].get_total_processed_packet(), 
-                    sources['Video Source'].get_total_processed_packet(), 
-                    result.total_processed_packet, 
-                    confidence_data_source, 
-                    confidence_voice_source, 
-                    confidence_video_source,
-                    confidence_total]
-            
-            write_to_file(data)
-            print("Stopping simulation: All confidence intervals are below the threshold.")
-            break
-
-        yield env.timeout(block_size)  # Check every simulation time unit
-
-def init_file():
-    with open("data.csv", "w") as file:
+            if verbose:
+                print("Stopping simulation: All confidence intervals are below the threshold.")
+            return result_row(env, burstiness, sources, result, ratios)
+
+        if env.now >= scenario.max_simulation_duration:
+            if verbose:
+                print("Stopping simulation: max_simulation_duration reached before the threshold.")
+            return result_row(env, burstiness, sources, result, ratios)
+
+        if trace_sources and all(source.finished for source in trace_sources):
+            trace_end = max(source.trace.end_time - source.trace.start_time for source in trace_sources)
+            if verbose:
+                print(f"Stopping simulation: the trace ended at {trace_end:.2f} before the threshold.")
+            row = result_row(env, burstiness, sources, result, ratios)
+            row[1] = trace_end
+            return row
+
+        blocks = 1
+        if controller is not None:
+            blocks = controller.next_check_blocks(env.now, ratios)
+            if verbose:
+                controller.report(env.now, list(sources) + ["Total"], ratios)
+        yield from wait(blocks)  # Check every simulation time unit
+
+def create_model(env, burstiness, seed_sequence=None, antithetic=False, control_variates=False, scenario=None):
+    if seed_sequence is None:
+        seed_sequence = np.random.SeedSequence()
+    if scenario is None:
+        scenario = Scenario()
+    # Source streams are derived from the seed without spawning, so the same
+    # seed gives the same streams to every burstiness point and to an
+    # antithetic twin (common random numbers).
+    source_seeds = [np.random.SeedSequence(seed_sequence.entropy, spawn_key=seed_sequence.spawn_key + (i,)) for i in range(3)]
+    data_rng, voice_rng, video_rng = [np.random.default_rng(s) for s in source_seeds]
+
+    result = Result(env, scenario.block_size)
+    result.control_variates = control_variates
+    q = QueueClass(env, scenario.service_rate, buffer=create_scheduler(scenario.scheduler, scenario.scheduler_priorities,
+                                                                       scenario.scheduler_weights, scenario.scheduler_quanta))
+    if scenario.trace is not None:
+        # Recorded traffic instead of the three generators; burstiness only
+        # labels the row.
+        if antithetic or control_variates:
+            raise ValueError("Trace-driven sources have no random draws for antithetic or control variates")
+        trace = Trace(scenario.trace)
+        sources = {name: TraceSource(env, q, trace, source_id, result, buffer_size=scenario.variate_buffer_size)
+                   for source_id, name in enumerate(["Data Source", "Voice Source", "Video Source"])}
+        return sources, result
+
+    schedule = create_schedule(scenario.rate_schedule)
+    if schedule is not None and control_variates:
+        raise ValueError("Control variates need a constant offered load, not a rate schedule")
+    data_source = DataSource(env, q, scenario.data_rate, result, rng=data_rng, buffer_size=scenario.variate_buffer_size,
+                             packet_sizes=scenario.data_packet_sizes, packet_size_probabilities=scenario.data_packet_size_probabilities, schedule=schedule)
+    voice_source = VoiceSource(env, q, scenario.voice_packet_size, scenario.voice_rate, result, rng=voice_rng, buffer_size=scenario.variate_buffer_size,
+                               schedule=schedule)
+    video_source = VideoSource(env, q, scenario.video_packet_size, burstiness, scenario.video_rate, scenario.video_on_time_average, result,
+                               rng=video_rng, buffer_size=scenario.variate_buffer_size, schedule=schedule)
+    # Known mean of the control variate: data and voice send at their nominal
+    # rates on average, video at the rate of its discretized bursts.
+    result.offered_rate = scenario.data_rate + scenario.voice_rate + video_source.mean_rate()
+
+    sources = {
+        "Data Source": data_source,
+        "Voice Source": voice_source,
+        "Video Source": video_source
+    }
+
+    for source in sources.values():
+        source.antithetic = antithetic
+        source.control_variates = control_variates
+
+    return sources, result
+
+def model_state(sources, result):
+    state = {name: source.get_state() for name, source in sources.items()}
+    state["queue"] = next(iter(sources.values())).queue.get_state()
+    state["result"] = result.get_state()
+    return state
+
+def set_model_state(sources, result, state):
+    next(iter(sources.values())).queue.set_state(state["queue"])
+    result.set_state(state["result"])
+    for name, source in sources.items():
+        source.set_state(state[name])
+
+def simulate_burstiness(burstiness, seed_sequence=None, verbose=True, variance_reduction=None, backend="simpy", checkpoint=None, resume=False, scenario=None, profiler=None):
+    # With a Checkpoint, the model is saved every checkpoint.every blocks and
+    # once more with the result row when the run stops. resume picks up from
+    # the saved snapshot, or returns its row if the run had already finished.
+    if variance_reduction is None:
+        variance_reduction = VarianceReduction()
+    if seed_sequence is None:
+        seed_sequence = np.random.SeedSequence()
+
+    flags = [variance_reduction.antithetic, variance_reduction.control_variates]
+    state = checkpoint.load() if resume and checkpoint is not None and checkpoint.exists() else None
+    if state is not None:
+        if float(state["burstiness"]) != burstiness or state["flags"].tolist() != flags:
+            raise ValueError(f"{checkpoint.path} was saved for another burstiness or variance reduction")
+        if "row" in state:
+            return json.loads(str(state["row"]))
+
+    env = create_environment(backend, float(state["now"]) if state is not None else 0)
+    models = [create_model(env, burstiness, seed_sequence, control_variates=variance_reduction.control_variates, scenario=scenario)]
+    if variance_reduction.antithetic:
+        models.append(create_model(env, burstiness, seed_sequence, antithetic=True, control_variates=variance_reduction.control_variates, scenario=scenario))
+    if state is not None:
+        for i, (model_sources, model_result) in enumerate(models):
+            set_model_state(model_sources, model_result, state["models"][str(i)])
+        checkpoint.blocks = checkpoint.saved_blocks = int(state.get("checkpoint_blocks", 0))
+
+    sources, result = models[0]
+    if variance_reduction.antithetic:
+        twin_sources, twin_result = models[1]
+        sources = {name: AntitheticPair(sources[name], twin_sources[name]) for name in sources}
+        result = AntitheticPair(result, twin_result)
+
+    # Blocks left until the next stopping check, saved so a resumed run checks
+    # at the same times as an uninterrupted one.
+    check_blocks = [1]
+
+    def simulation_state():
+        return {"now": env.now, "check_blocks": check_blocks[0], "checkpoint_blocks": checkpoint.blocks, "burstiness": burstiness, "flags": flags,
+                "models": {str(i): model_state(model_sources, model_result) for i, (model_sources, model_result) in enumerate(models)}}
+
+    def save_snapshot(blocks):
+        check_blocks[0] = blocks
+        if checkpoint.due():
+            checkpoint.save(simulation_state())
+        return checkpoint.step(blocks)
+
+    resume_blocks = int(state.get("check_blocks", 1)) if state is not None else None
+    if profiler is not None:
+        for model_sources, model_result in models:
+            profiler.instrument(env, model_sources, model_result)
+        profiler.instrument_checks(sources, result)
+    proc = env.process(check_stopping_condition(env, burstiness, sources, result, verbose, save_snapshot if checkpoint is not None else None, resume_blocks, scenario))
+    row = profiler.run(env, proc) if profiler is not None else env.run(until=proc)
+
+    if checkpoint is not None:
+        final_state = simulation_state()
+        final_state["row"] = json.dumps(row)
+        checkpoint.save(final_state)
+    return row
+
+def init_file(filename="data.csv"):
+    with open(filename, "w") as file:
         writer = csv.writer(file)
         writer.writerow(headers)
 
-def write_to_file(data):
-    with open("data.csv", "a") as file:
+def write_to_file(data, filename="data.csv"):
+    with open(filename, "a") as file:
         writer = csv.writer(file)
         writer.writerow(data)
 
@@ -302,34 +954,45 @@ headers = ["burstiness",
            "video_confidence_interval",
            "total_confidence_interval"]
 
-init_file()
+# Part of the key of every cached result (result_store.py): bump it with any
+# change that alters the results of a run.
+model_version = 1
 
 min_simulation_duration = 1000
 max_simulation_duration = 100000
 block_size = 50
 confidence_threshold = 0.05
-
-for burstiness in np.arange(20.0, 101, 10):
-    print(f"Burstiness: {burstiness}")
-
-    env = simpy.Environment()
-    result = Result(env)
-    q = QueueClass(env, 100 * math.pow(10, 6))
-    data_source = DataSource(env, q, 30 * math.pow(10, 6), result)
-    voice_source = VoiceSource(env, q, 800, 20 * math.pow(10, 6), result)
-    video_source = VideoSource(env, q, 8000, burstiness,30 * math.pow(10, 6), 0.001, result)
-    
-    sources = {
-        "Data Source": data_source,
-        "Voice Source": voice_source,
-        "Video Source": video_source
-    }
-
-    proc = env.process(check_stopping_condition(env, burstiness, sources, result))
-
-    env.run(until=proc)
-
-    print("")
-
-
-    
\ No newline at end of file
+adaptive_stopping = False
+variate_buffer_size = 65536
+
+service_rate = 100 * math.pow(10, 6)
+data_rate = 30 * math.pow(10, 6)
+data_packet_sizes = [400, 4000, 12000]
+data_packet_size_probabilities = [0.4, 0.3, 0.3]
+voice_packet_size = 800
+voice_rate = 20 * math.pow(10, 6)
+video_packet_size = 8000
+video_rate = 30 * math.pow(10, 6)
+video_on_time_average = 0.001
+
+# "fifo", "priority" (strict, non-preemptive), "wfq" or "drr". Per-class
+# settings are in source order Data, Voice, Video: priority levels (lowest
+# served first), WFQ weights and DRR quanta in bits.
+scheduler = "fifo"
+scheduler_priorities = [1, 0, 2]
+scheduler_weights = [1.0, 1.0, 1.0]
+scheduler_quanta = [12000, 12000, 12000]
+
+# .npy packet trace replayed instead of the generated traffic (see traces.py)
+trace = None
+
+# Load profile applied to the rates of all three sources, None for constant
+# rates (see rate_schedule.py)
+rate_schedule = None
+
+if __name__ == "__main__":
+    # The sweep and its options (result store, engines, scenarios) live in
+    # simulate.py.
+    import simulate
+
+    simulate.main()
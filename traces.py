@@ -0,0 +1,103 @@
+import argparse
+import os
+import shutil
+
+import numpy as np
+
+# Packet traces are .npy files of 16-byte records: arrival time in seconds,
+# packet size in bits and class, the source id of the model (0 data, 1 voice,
+# 2 video). Records are in arrival order. A Trace maps one window of records
+# at a time and drops it before mapping the next, so replaying a trace keeps
+# a constant footprint whatever its length.
+
+record_dtype = np.dtype([("time", "<f8"), ("size", "<i4"), ("source_id", "<i4")])
+
+class Trace(object):
+    def __init__(self, path):
+        records = np.load(path, mmap_mode="r")
+        if records.dtype != record_dtype or records.ndim != 1:
+            raise ValueError(f"{path} is not a packet trace (expected a 1-d array of {record_dtype})")
+        self.path = path
+        self.count = len(records)
+        self.offset = records.offset
+        self.start_time = float(records[0]["time"]) if self.count else 0.0
+        self.end_time = float(records[-1]["time"]) if self.count else 0.0
+        del records
+
+    def __len__(self):
+        return self.count
+
+    def window(self, start, count):
+        # Records start to start + count, read-only and mapped from the file.
+        count = min(count, self.count - start)
+        if count <= 0:
+            return np.empty(0, dtype=record_dtype)
+        return np.memmap(self.path, dtype=record_dtype, mode="r", offset=self.offset + start * record_dtype.itemsize, shape=(count,))
+
+def convert_text(source, destination, time_column=0, size_column=1, class_column=None, source_id=0, delimiter=",", header=False,
+                 size_scale=1, chunk_size=1 << 20):
+    # Parses a delimited text trace chunk by chunk into records written beside
+    # the destination, then prefixes the .npy header once the count is known.
+    # Without a class column every packet gets source_id. Returns the count.
+    import pandas as pd
+
+    columns = [time_column, size_column] + ([class_column] if class_column is not None else [])
+    raw_path = destination + ".records"
+    count = 0
+    last_time = -np.inf
+    try:
+        with open(raw_path, "wb") as raw:
+            chunks = pd.read_csv(source, sep=delimiter, header=None, skiprows=1 if header else 0, usecols=columns, comment="#",
+                                 chunksize=chunk_size)
+            for chunk in chunks:
+                records = np.empty(len(chunk), dtype=record_dtype)
+                records["time"] = chunk[time_column].to_numpy(dtype=float)
+                records["size"] = np.rint(chunk[size_column].to_numpy(dtype=float) * size_scale)
+                records["source_id"] = chunk[class_column].to_numpy() if class_column is not None else source_id
+                if len(records) == 0:
+                    continue
+                decreasing = np.diff(records["time"], prepend=last_time) < 0
+                if decreasing.any():
+                    raise ValueError(f"{source}: arrival times decrease at row {count + int(np.argmax(decreasing))}")
+                if np.any(records["size"] <= 0):
+                    raise ValueError(f"{source}: packet sizes must be positive (row {count + int(np.argmax(records['size'] <= 0))})")
+                last_time = records["time"][-1]
+                records.tofile(raw)
+                count += len(records)
+
+        temporary = destination + ".tmp"
+        with open(temporary, "wb") as file:
+            np.lib.format.write_array_header_1_0(file, {"descr": np.lib.format.dtype_to_descr(record_dtype), "fortran_order": False, "shape": (count,)})
+            with open(raw_path, "rb") as raw:
+                shutil.copyfileobj(raw, file, 16 << 20)
+        os.replace(temporary, destination)
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a text packet trace (CSV, or fields exported from a pcap, e.g. by tshark -T fields) "
+                                                 "into the .npy records replayed by trace-driven sources.")
+    parser.add_argument("source")
+    parser.add_argument("destination", help=".npy file to write")
+    parser.add_argument("--time-column", type=int, default=0)
+    parser.add_argument("--size-column", type=int, default=1)
+    parser.add_argument("--class-column", type=int, default=None, help="column holding the source id; without it every packet gets --source-id")
+    parser.add_argument("--source-id", type=int, default=0)
+    parser.add_argument("--delimiter", default=",", help="field separator, 'whitespace' for runs of blanks")
+    parser.add_argument("--header", action="store_true", help="skip the first line")
+    parser.add_argument("--bytes", action="store_true", help="sizes are in bytes, as in pcap exports, and are converted to bits")
+    parser.add_argument("--chunk-size", type=int, default=1 << 20, help="rows parsed at a time")
+    args = parser.parse_args(argv)
+
+    delimiter = r"\s+" if args.delimiter == "whitespace" else args.delimiter
+    count = convert_text(args.source, args.destination, args.time_column, args.size_column, args.class_column, args.source_id, delimiter,
+                         args.header, 8 if args.bytes else 1, args.chunk_size)
+    trace = Trace(args.destination)
+    last = trace.window(count - 1, 1)
+    duration = float(last["time"][0]) - trace.start_time if count else 0.0
+    print(f"{count} packets over {duration:g} s written to {args.destination}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+import simulation_project as sp
+from batch_means import BatchMeans
+from event_kernel import create_environment
+
+DATA, VOICE, VIDEO = 0, 1, 2
+SOURCE_NAMES = ["Data Source", "Voice Source", "Video Source"]
+
+def fifo_departures(arrivals, service_times, last_departure=0.0):
+    # Lindley recursion D[n] = max(A[n], D[n-1]) + S[n] in closed form:
+    # D[n] = C[n] + max(D[-1], max_{k<=n}(A[k] - C[k-1])) with C the cumulative service.
+    cumulative_service = np.cumsum(service_times)
+    start_offset = np.maximum.accumulate(arrivals - (cumulative_service - service_times))
+    return cumulative_service + np.maximum(start_offset, last_departure)
+
+class ArrivalStream(object):
+    def __init__(self, rng):
+        self.rng = rng
+        self.pending_times = np.empty(0)
+        self.pending_sizes = np.empty(0)
+
+    def draw(self, span):
+        pass
+
+    def generate(self, until):
+        times = [self.pending_times]
+        sizes = [self.pending_sizes]
+        last_time = self.pending_times[-1] if len(self.pending_times) > 0 else -math.inf
+        while last_time <= until:
+            new_times, new_sizes = self.draw(until - max(last_time, 0.0))
+            times.append(new_times)
+            sizes.append(new_sizes)
+            if len(new_times) > 0:
+                last_time = new_times[-1]
+
+        times = np.concatenate(times)
+        sizes = np.concatenate(sizes)
+        split = np.searchsorted(times, until, side="right")
+        self.pending_times = times[split:]
+        self.pending_sizes = sizes[split:]
+        return times[:split], sizes[:split]
+
+class DataArrivals(ArrivalStream):
+    def __init__(self, rng, rate, packet_sizes=sp.data_packet_sizes, packet_size_probabilities=sp.data_packet_size_probabilities):
+        super().__init__(rng)
+        self.rate = rate
+        self.packet_sizes = packet_sizes
+        self.packet_size_probabilities = packet_size_probabilities
+        self.last_time = 0.0
+        self.mean_packet_size = float(np.dot(packet_sizes, packet_size_probabilities))
+
+    def draw(self, span):
+        count = int(span * self.rate / self.mean_packet_size * 1.05) + 64
+        sizes = self.rng.choice(self.packet_sizes, size=count, p=self.packet_size_probabilities)
+        times = self.last_time + np.cumsum(self.rng.exponential(sizes / self.rate))
+        self.last_time = times[-1]
+        return times, sizes
+
+class VoiceArrivals(ArrivalStream):
+    def __init__(self, rng, packet_size, rate):
+        super().__init__(rng)
+        self.packet_size = packet_size
+        self.sending_time = float(packet_size / rate)
+        self.packet_count = 0
+
+    def draw(self, span):
+        count = int(span / self.sending_time) + 1
+        times = (self.packet_count + np.arange(1, count + 1)) * self.sending_time
+        self.packet_count += count
+        return times, np.full(count, self.packet_size)
+
+class VideoArrivals(ArrivalStream):
+    def __init__(self, rng, packet_size, burstiness, rate, on_time_average, off_poll_interval=0.00001):
+        super().__init__(rng)
+        self.packet_size = packet_size
+        self.on_time_average = on_time_average
+        self.off_time_average = float(burstiness * on_time_average) - on_time_average
+        self.sending_time = float(packet_size / (burstiness * rate))
+        self.off_poll_interval = off_poll_interval
+        self.period_start = 0.0
+
+    def draw(self, span):
+        # Same period plan as VideoSource.next_period.
+        periods = int(span / (self.on_time_average + self.off_time_average) * 1.05) + 4
+        on_time = self.rng.exponential(self.on_time_average, periods)
+        off_time = self.rng.exponential(self.off_time_average, periods)
+        burst_packets = np.ceil(on_time / self.sending_time).astype(np.int64)
+        off_duration = np.ceil(off_time / self.off_poll_interval) * self.off_poll_interval
+        period_length = burst_packets * self.sending_time + off_duration
+        period_starts = self.period_start + np.cumsum(period_length) - period_length
+        self.period_start = period_starts[-1] + period_length[-1]
+
+        total = int(burst_packets.sum())
+        first_index = np.cumsum(burst_packets) - burst_packets
+        index_in_burst = np.arange(1, total + 1) - np.repeat(first_index, burst_packets)
+        times = np.repeat(period_starts, burst_packets) + index_in_burst * self.sending_time
+        return times, np.full(total, self.packet_size)
+
+def average_response_time(estimator):
+    average = estimator.average()
+    if average is None:
+        return 1
+
+    return average
+
+def confidence_interval(estimator, now):
+    if estimator.count <= 1:
+        return 1
+
+    return estimator.half_width(now)
+
+class VectorizedFifo(object):
+    def __init__(self, burstiness, rng=None, block_size=None, scenario=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.scenario = scenario if scenario is not None else sp.Scenario()
+        if self.scenario.scheduler != "fifo":
+            raise ValueError(f"The vectorized engine only models a FIFO queue, not {self.scenario.scheduler}")
+        if self.scenario.trace is not None:
+            raise ValueError("The vectorized engine only generates traffic, it does not replay traces")
+        if self.scenario.rate_schedule is not None:
+            raise ValueError("The vectorized engine only models constant rates")
+        if block_size is None:
+            block_size = self.scenario.block_size
+        self.burstiness = burstiness
+        self.now = 0.0
+        self.streams = [
+            DataArrivals(self.rng, self.scenario.data_rate, self.scenario.data_packet_sizes, self.scenario.data_packet_size_probabilities),
+            VoiceArrivals(self.rng, self.scenario.voice_packet_size, self.scenario.voice_rate),
+            VideoArrivals(self.rng, self.scenario.video_packet_size, burstiness, self.scenario.video_rate, self.scenario.video_on_time_average),
+        ]
+        self.last_departure = 0.0
+        self.in_flight_arrivals = np.empty(0)
+        self.in_flight_departures = np.empty(0)
+        self.in_flight_sources = np.empty(0, dtype=np.int8)
+        self.sent_packet = [0, 0, 0]
+        self.sources = [BatchMeans(block_size) for _ in SOURCE_NAMES]
+        self.result = BatchMeans(block_size)
+
+    def advance(self, until):
+        times, sizes, source_ids = [], [], []
+        for source_id, stream in enumerate(self.streams):
+            stream_times, stream_sizes = stream.generate(until)
+            times.append(stream_times)
+            sizes.append(stream_sizes)
+            source_ids.append(np.full(len(stream_times), source_id, dtype=np.int8))
+            self.sent_packet[source_id] += len(stream_times)
+
+        times = np.concatenate(times)
+        order = np.argsort(times, kind="stable")
+        arrivals = times[order]
+        service_times = np.concatenate(sizes)[order] / self.scenario.service_rate
+        source_ids = np.concatenate(source_ids)[order]
+
+        departures = fifo_departures(arrivals, service_times, self.last_departure)
+        if len(departures) > 0:
+            self.last_departure = departures[-1]
+
+        arrivals = np.concatenate([self.in_flight_arrivals, arrivals])
+        departures = np.concatenate([self.in_flight_departures, departures])
+        source_ids = np.concatenate([self.in_flight_sources, source_ids])
+        split = np.searchsorted(departures, until, side="right")
+        self.in_flight_arrivals = arrivals[split:]
+        self.in_flight_departures = departures[split:]
+        self.in_flight_sources = source_ids[split:]
+
+        departures = departures[:split]
+        response_times = departures - arrivals[:split]
+        source_ids = source_ids[:split]
+        for source_id, estimator in enumerate(self.sources):
+            mask = source_ids == source_id
+            estimator.add_many(departures[mask], response_times[mask])
+        self.result.add_many(departures, response_times)
+        self.now = until
+
+    def confidence(self):
+        estimators = self.sources + [self.result]
+        return [confidence_interval(e, self.now) / average_response_time(e) for e in estimators]
+
+    def row(self):
+        return ([self.burstiness, self.now]
+                + [average_response_time(e) for e in self.sources + [self.result]]
+                + self.sent_packet + [sum(self.sent_packet)]
+                + [e.total_count() for e in self.sources] + [self.result.total_count()]
+                + self.confidence())
+
+def run_until_confidence(burstiness, rng=None, verbose=True, scenario=None):
+    engine = VectorizedFifo(burstiness, rng, scenario=scenario)
+    scenario = engine.scenario
+    controller = sp.AdaptiveStopping(scenario) if scenario.adaptive_stopping else None
+    blocks = 1
+    while True:
+        # Advanced block by block to bound the arrays, checked only after
+        # the blocks the controller asked for.
+        for _ in range(blocks):
+            engine.advance(engine.now + scenario.block_size)
+        confidence = engine.confidence()
+        if verbose:
+            for name, value in zip(SOURCE_NAMES + ["Total"], confidence):
+                print(f"Time {engine.now:.2f}: Confidence {name}: {value}")
+
+        if engine.now >= scenario.min_simulation_duration and all(value < scenario.confidence_threshold for value in confidence):
+            if verbose:
+                print("Stopping simulation: All confidence intervals are below the threshold.")
+            return engine.row()
+
+        if engine.now >= scenario.max_simulation_duration:
+            if verbose:
+                print("Stopping simulation: max_simulation_duration reached before the threshold.")
+            return engine.row()
+
+        if controller is not None:
+            blocks = controller.next_check_blocks(engine.now, confidence)
+            if verbose:
+                controller.report(engine.now, SOURCE_NAMES + ["Total"], confidence)
+
+def cross_check(burstiness_values, horizon, seed):
+    print(f"{'burstiness':>10} {'source':<14}{'simpy':>14}{'vectorized':>14}{'vec. CI':>12}{'rel. diff':>11}")
+    for burstiness in burstiness_values:
+        env = create_environment("simpy")
+        sources, result = sp.create_model(env, burstiness, np.random.SeedSequence(seed))
+        start_time = time.perf_counter()
+        env.run(until=horizon)
+        simpy_duration = time.perf_counter() - start_time
+        simpy_values = [s.get_average_response_time() for s in sources.values()] + [result.get_average_response_time()]
+
+        engine = VectorizedFifo(burstiness, np.random.default_rng(seed), block_size=horizon / 20)
+        start_time = time.perf_counter()
+        engine.advance(horizon)
+        vectorized_duration = time.perf_counter() - start_time
+
+        for name, simpy_value, estimator in zip(SOURCE_NAMES + ["Total"], simpy_values, engine.sources + [engine.result]):
+            vectorized_value = average_response_time(estimator)
+            interval = confidence_interval(estimator, horizon)
+            print(f"{burstiness:>10.1f} {name:<14}{simpy_value:>14.6e}{vectorized_value:>14.6e}{interval:>12.2e}{(vectorized_value - simpy_value) / simpy_value:>11.2%}")
+        print(f"{'':>10} duration: simpy {simpy_duration:.2f} s, vectorized {vectorized_duration:.2f} s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized FIFO engine for the Data/Voice/Video response-time study.")
+    parser.add_argument("--burstiness", type=float, nargs="+", default=list(np.arange(20.0, 101, 10)))
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="data.csv")
+    parser.add_argument("--cross-check", action="store_true", help="compare against the simpy engine on a short horizon")
+    parser.add_argument("--horizon", type=float, default=20.0, help="simulated time of each cross-check run")
+    args = parser.parse_args()
+
+    if args.cross_check:
+        cross_check(args.burstiness, args.horizon, args.seed if args.seed is not None else 10)
+        return
+
+    rng = np.random.default_rng(args.seed)
+    sp.init_file(args.output)
+    for burstiness in args.burstiness:
+        print(f"Burstiness: {burstiness}")
+        sp.write_to_file(run_until_confidence(burstiness, rng), args.output)
+        print("")
+
+if __name__ == "__main__":
+    main()